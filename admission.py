@@ -0,0 +1,124 @@
+import asyncio
+import os
+from collections import deque
+
+from starlette.responses import JSONResponse
+
+# Threads of the default threadpool that sync routes run in (anyio's limit)
+THREADPOOL_THREADS = 40
+# Threads always left to routes without a budget (login, signup, ...)
+RESERVED_THREADS = 8
+
+# Per-route admission budgets: (concurrent requests, queued requests, max
+# seconds a request may wait in the queue).
+FIXED_BUDGETS = {
+    "/heatmap": (2, 8, 2.0),
+    "/hotspots": (1, 4, 2.0),
+    "/crimes": (4, 32, 2.0),
+}
+
+# Slots for each of the CPU-bound routes (/analyze, /nearby): about one per
+# core, since the numpy work releases the GIL. Beyond that extra concurrency
+# only adds latency for everybody, /emergency included. Capped so that all
+# budgets together leave RESERVED_THREADS of the threadpool free.
+CPU_SLOTS = max(2, min(
+    os.cpu_count() or 1,
+    (THREADPOOL_THREADS - RESERVED_THREADS - sum(spec[0] for spec in FIXED_BUDGETS.values())) // 2
+))
+
+ROUTE_BUDGETS = {
+    "/analyze": (CPU_SLOTS, 16, 1.0),
+    "/nearby": (CPU_SLOTS, 16, 1.0),
+    **FIXED_BUDGETS,
+}
+
+# Never limited or queued, whatever the load on other routes
+PRIORITY_ROUTES = ("/emergency",)
+
+RETRY_AFTER_SECONDS = 1
+
+
+class Budget:
+    """Concurrency limit with a bounded FIFO queue, for use on one event loop."""
+
+    def __init__(self, limit, queue_size, queue_timeout):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.shed = 0
+        self._waiters = deque()
+
+    async def acquire(self):
+        """Take a slot, waiting in the queue if needed. Returns False if the request must be shed."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            self.shed += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # The slot was handed over just as the timeout fired
+                return True
+            self._waiters.remove(waiter)
+            self.shed += 1
+            return False
+        except asyncio.CancelledError:
+            # Client went away while queued; give back a slot it may have been handed
+            if waiter.done():
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self):
+        # Hand the slot straight to the next waiter so active stays constant
+        if self._waiters:
+            self._waiters.popleft().set_result(None)
+        else:
+            self.active -= 1
+
+
+class AdmissionControl:
+    """ASGI middleware enforcing ROUTE_BUDGETS and shedding excess load with 503s.
+
+    Requests to PRIORITY_ROUTES and to routes without a budget pass straight
+    through. Budgeted routes run if a slot is free, wait briefly in a
+    bounded queue otherwise, and get 503 + Retry-After when the queue is
+    full or the wait times out.
+    """
+
+    def __init__(self, app, budgets=None):
+        self.app = app
+        self.budgets = {path: Budget(*spec) for path, spec in (budgets or ROUTE_BUDGETS).items()}
+
+    def _budget_for(self, path):
+        if path.startswith(PRIORITY_ROUTES):
+            return None
+        return self.budgets.get(path.rstrip("/") or "/")
+
+    async def __call__(self, scope, receive, send):
+        budget = self._budget_for(scope["path"]) if scope["type"] == "http" else None
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await budget.acquire():
+            response = JSONResponse(
+                {"detail": "Server busy, please retry"},
+                status_code=503,
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            budget.release()
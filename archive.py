@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""Hot/cold partitioning of crime history.
+
+crime_records holds the hot partition: the last HOT_MONTHS months, which
+the API keeps in memory as a CrimeIndex. ``roll_over`` moves older crimes to
+crime_archive (cold, queried only on demand) and adds them to
+crime_cell_summary, per-cell counts small enough to keep in memory.
+The API runs it every ROLLOVER_INTERVAL_HOURS if that is set; it can also
+be run by hand:
+
+    python archive.py
+"""
+import math
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, insert, text
+
+from crime_index import CELL_DEG, COLUMNS, HOURS, SEVERITY_LEVELS, CrimeIndex, bbox_clause, cell_intersects
+from database import engine, SessionLocal
+from dataset import bump_version, set_version
+from grid import cells_covering
+from models import CrimeArchive, CrimeCellSummary, CrimeRecord
+
+# Crimes older than this many months are rolled out of crime_records
+HOT_MONTHS = int(os.getenv('HOT_MONTHS', '24'))
+# How often the API runs roll_over, starting one interval after startup.
+# Off by default: the first run archives everything older than HOT_MONTHS.
+ROLLOVER_INTERVAL_HOURS = float(os.getenv('ROLLOVER_INTERVAL_HOURS', '0'))
+
+DELETE_CHUNK = 500
+
+
+def hot_cutoff(now=None, months=HOT_MONTHS):
+    """Start of the hot partition: crimes dated before this belong in the archive."""
+    return pd.Timestamp(now or datetime.now()).normalize() - pd.DateOffset(months=months)
+
+
+def roll_over(now=None, months=HOT_MONTHS):
+    """Move crimes older than the hot window to the archive. Returns how many moved.
+
+    The move, the summary update and the dataset version bump share one
+    transaction, so readers see either the old or the new layout. The
+    transaction holds SQLite's write lock from the start: concurrent runs
+    are serialized.
+    """
+    cutoff = hot_cutoff(now, months)
+    db = SessionLocal()
+    try:
+        # Take the write lock before reading, so a concurrent run (another
+        # worker, or a hand run during a scheduled one) waits for this one and
+        # then finds nothing left to move instead of archiving the same rows
+        db.execute(text("BEGIN IMMEDIATE"))
+        df = pd.read_sql(
+            text("SELECT id, latitude, longitude, severity, crime_date, time, crime_type FROM crime_records"),
+            db.connection()
+        )
+        # crime_date comes in several formats, so compare parsed dates. Rows
+        # with no parseable date stay hot.
+        dates = pd.to_datetime(df["crime_date"], format="mixed", errors="coerce")
+        old = df[dates < cutoff].copy()
+        if old.empty:
+            return 0
+
+        old["crime_date"] = dates[old.index].dt.strftime("%Y-%m-%d")
+        old["severity"] = old["severity"].fillna(1).astype(int)
+        old["crime_type"] = old["crime_type"].fillna("Unknown")
+        old = old.astype(object).where(old.notna(), None)
+        db.execute(insert(CrimeArchive), old.rename(columns={"id": "source_id"}).to_dict("records"))
+
+        located = old.dropna(subset=["latitude", "longitude"])
+        if not located.empty:
+            lats = located["latitude"].to_numpy(dtype=np.float64)
+            lons = located["longitude"].to_numpy(dtype=np.float64)
+            # Hours parsed as CrimeIndex does, so archived crimes land in the same histogram bins
+            hours = pd.to_numeric(located["time"].astype(str).str[:2], errors="coerce").fillna(12).clip(0, 23)
+            summary = located.assign(
+                cell_row=np.floor(lats / CELL_DEG).astype(int),
+                cell_col=np.floor(lons / CELL_DEG).astype(int),
+                month=located["crime_date"].str[:7],
+                severity=located["severity"].astype(int),
+                hour=hours.astype(int),
+            ).groupby(["cell_row", "cell_col", "month", "crime_type", "severity", "hour"]).agg(
+                count=("id", "size"), severity_sum=("severity", "sum")
+            ).reset_index()
+            db.execute(insert(CrimeCellSummary), summary.astype(object).to_dict("records"))
+
+        ids = old["id"].tolist()
+        for i in range(0, len(ids), DELETE_CHUNK):
+            db.execute(delete(CrimeRecord).where(CrimeRecord.id.in_(ids[i:i + DELETE_CHUNK])))
+        version = bump_version(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    set_version(version)
+    return len(ids)
+
+
+class ColdSummary:
+    """Archived crime counts per grid cell and month, for scoring without the archive rows.
+
+    Each cell maps to arrays of (month start timestamp, crime count,
+    severity sum), and in ``totals`` to its (count, severity sum) over all
+    months. ``histograms`` holds each cell's type x severity x hour
+    histogram over all months, laid out like CrimeIndex.histograms with
+    types indexing ``type_names``. ``archived_until`` is the timestamp of
+    the end of the newest archived day, or None when nothing has been
+    archived.
+    """
+
+    def __init__(self, df, archived_until=None, hist_df=None):
+        self.archived_until = archived_until
+        self.cells = {}
+        self.totals = {}
+        self.type_names = []
+        self.histograms = {}
+        if hist_df is not None and not hist_df.empty:
+            self._build_histograms(hist_df)
+        if df.empty:
+            return
+        ts = pd.to_datetime(df["month"] + "-01", errors="coerce").astype("datetime64[s]").astype(np.int64).to_numpy()
+        counts = df["count"].to_numpy(dtype=np.float64)
+        severity = df["severity_sum"].to_numpy(dtype=np.float64)
+        for (row, col), positions in df.groupby(["cell_row", "cell_col"]).indices.items():
+            cell = (int(row), int(col))
+            self.cells[cell] = (ts[positions], counts[positions], severity[positions])
+            self.totals[cell] = (int(counts[positions].sum()), float(severity[positions].sum()))
+
+    def _build_histograms(self, df):
+        codes, names = pd.factorize(df["crime_type"].fillna("Unknown"))
+        self.type_names = list(names)
+        severity = df["severity"].fillna(1).clip(1, SEVERITY_LEVELS).to_numpy(dtype=np.int64) - 1
+        hour = df["hour"].fillna(12).clip(0, HOURS - 1).to_numpy(dtype=np.int64)
+        keys = (codes.astype(np.int64) * SEVERITY_LEVELS + severity) * HOURS + hour
+        counts = df["count"].to_numpy(dtype=np.int64)
+        width = len(names) * SEVERITY_LEVELS * HOURS
+        for (row, col), positions in df.groupby(["cell_row", "cell_col"]).indices.items():
+            hist = np.bincount(keys[positions], weights=counts[positions], minlength=width)
+            self.histograms[(int(row), int(col))] = hist.astype(np.int32).reshape(len(names), SEVERITY_LEVELS, HOURS)
+
+    @property
+    def nbytes(self):
+        return (
+            sum(col.nbytes for cols in self.cells.values() for col in cols) +
+            sum(hist.nbytes for hist in self.histograms.values())
+        )
+
+    def centres(self):
+        """(latitudes, longitudes, crime counts) of the archived cells' centres."""
+        cells = np.array(list(self.totals), dtype=np.float64).reshape(-1, 2)
+        counts = np.array([count for count, _ in self.totals.values()], dtype=np.float64)
+        return (cells[:, 0] + 0.5) * CELL_DEG, (cells[:, 1] + 0.5) * CELL_DEG, counts
+
+    def around(self, lat, lon, radius_km):
+        """(month timestamps, counts, severity sums) of the cells intersecting the circle.
+
+        Like CrimeIndex.profile, edge cells are counted whole.
+        """
+        parts = [
+            self.cells[cell] for cell in cells_covering(lat, lon, radius_km, CELL_DEG)
+            if cell in self.cells and cell_intersects(cell, lat, lon, radius_km)
+        ]
+        if not parts:
+            empty = np.zeros(0)
+            return empty.astype(np.int64), empty, empty
+        return tuple(np.concatenate(cols) for cols in zip(*parts))
+
+
+def _cell_clause(bbox, exclude=()):
+    """Like bbox_clause, for the grid cells of crime_cell_summary that intersect the boxes."""
+    clauses, params = [], {}
+    for prefix, box in [("", bbox)] + [(f"x{i}_", box) for i, box in enumerate(exclude)]:
+        if box is None:
+            continue
+        min_lat, min_lon, max_lat, max_lon = box
+        clause = (
+            f"cell_row BETWEEN :{prefix}min_row AND :{prefix}max_row AND "
+            f"cell_col BETWEEN :{prefix}min_col AND :{prefix}max_col"
+        )
+        clauses.append(f"NOT ({clause})" if prefix else clause)
+        params.update({
+            f"{prefix}min_row": math.floor(min_lat / CELL_DEG), f"{prefix}max_row": math.floor(max_lat / CELL_DEG),
+            f"{prefix}min_col": math.floor(min_lon / CELL_DEG), f"{prefix}max_col": math.floor(max_lon / CELL_DEG),
+        })
+    return " AND ".join(clauses) or "1 = 1", params
+
+
+def load_cold_summary(bbox=None, exclude=()):
+    """Build a ColdSummary of the archive, restricted to the cells and rows in bbox and outside exclude."""
+    cell_where, cell_params = _cell_clause(bbox, exclude)
+    where, params = bbox_clause(bbox, exclude)
+    with engine.connect() as conn:
+        df = pd.read_sql(
+            text(
+                "SELECT cell_row, cell_col, month, SUM(count) AS count, SUM(severity_sum) AS severity_sum "
+                f"FROM crime_cell_summary WHERE {cell_where} GROUP BY cell_row, cell_col, month"
+            ),
+            conn,
+            params=cell_params
+        )
+        hist_df = pd.read_sql(
+            text(
+                "SELECT cell_row, cell_col, crime_type, severity, hour, SUM(count) AS count "
+                f"FROM crime_cell_summary WHERE {cell_where} GROUP BY cell_row, cell_col, crime_type, severity, hour"
+            ),
+            conn,
+            params=cell_params
+        )
+        newest = conn.execute(text(f"SELECT MAX(crime_date) FROM crime_archive WHERE {where}"), params).scalar()
+    archived_until = None
+    if newest:
+        archived_until = int((pd.Timestamp(newest) + pd.Timedelta(days=1)).value // 10**9)
+    return ColdSummary(df, archived_until, hist_df)
+
+
+def archived_index(lat, lon, radius_km, start=None, end=None):
+    """CrimeIndex of archived crimes in the bounding box of a circle, on the days from start to end.
+
+    Callers still apply the exact radius and ``window(start, end)``.
+    """
+    dlat = radius_km / 111.0
+    dlon = radius_km / (111.0 * max(np.cos(np.radians(lat)), 0.01))
+    query = (
+        "SELECT source_id AS id, latitude, longitude, severity, crime_date, time, crime_type FROM crime_archive "
+        "WHERE latitude BETWEEN :min_lat AND :max_lat AND longitude BETWEEN :min_lon AND :max_lon"
+    )
+    params = {"min_lat": lat - dlat, "max_lat": lat + dlat, "min_lon": lon - dlon, "max_lon": lon + dlon}
+    # Dates are stored as YYYY-MM-DD, so whole days can be filtered in SQL
+    if start is not None:
+        query += " AND crime_date >= :start"
+        params["start"] = pd.Timestamp(start, unit="s").strftime("%Y-%m-%d")
+    if end is not None:
+        query += " AND crime_date <= :end"
+        params["end"] = pd.Timestamp(end, unit="s").strftime("%Y-%m-%d")
+    with engine.connect() as conn:
+        df = pd.read_sql(text(query), conn, params=params)
+    return CrimeIndex(df)
+
+
+def _rows(index, positions):
+    """Rows at positions in the column dict format of CrimeIndex.with_rows."""
+    rows = {name: getattr(index, name)[positions] for name in COLUMNS if name != "type_code"}
+    rows["crime_type"] = np.asarray(index.types.names, dtype=object)[index.type_code[positions]]
+    return rows
+
+
+def with_archive(index, lat, lon, radius_km, start=None, end=None):
+    """Small index of the hot and archived crimes around (lat, lon) between start and end.
+
+    Used for historical queries reaching back past the hot partition.
+    """
+    hot = index.nearby(lat, lon, radius_km, index.window(start, end))
+    return archived_index(lat, lon, radius_km, start, end).with_rows(_rows(index, hot))
+
+
+if __name__ == "__main__":
+    from database import Base
+    Base.metadata.create_all(bind=engine)
+    print(f"Rolling crimes older than {hot_cutoff().date()} into the archive...")
+    try:
+        moved = roll_over()
+    except Exception as e:
+        print(f"❌ Roll-over failed: {e}")
+        exit(1)
+    print(f"✅ Archived {moved} crimes")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""Measure risk model inference latency at batch sizes from 1 to 10k.
+
+Run train_model.py first. Scores random points in each region the model has
+features for, timing feature lookup + predict together, and compares the
+per-point cost with the formula in model.py.
+"""
+import random
+import statistics
+import time
+
+import numpy as np
+
+from crime_index import load_index
+from model import calculate_risk
+from regions import load_regions
+from risk_model import load_risk_model
+
+BATCH_SIZES = (1, 10, 100, 1000, 10000)
+REPEATS = 20
+FORMULA_SAMPLES = 200
+
+model = load_risk_model()
+if model is None:
+    print("❌ No trained model found; run train_model.py first")
+    exit(1)
+
+regions = load_regions()
+for region in model.grids:
+    if region not in regions:
+        continue
+    min_lat, min_lon, max_lat, max_lon = regions[region]
+    print(f"\n{region}")
+    print(f"{'batch':>7} {'p50 ms':>9} {'p95 ms':>9} {'us/point':>9}")
+
+    for size in BATCH_SIZES:
+        timings = []
+        for _ in range(REPEATS):
+            lats = np.random.uniform(min_lat, max_lat, size)
+            lons = np.random.uniform(min_lon, max_lon, size)
+            start = time.perf_counter()
+            model.predict(region, lats, lons)
+            timings.append((time.perf_counter() - start) * 1000)
+        p50 = statistics.median(timings)
+        p95 = statistics.quantiles(timings, n=20)[-1]
+        print(f"{size:>7} {p50:>9.2f} {p95:>9.2f} {p50 * 1000 / size:>9.1f}")
+
+    index, _ = load_index(regions[region])
+    start = time.perf_counter()
+    for _ in range(FORMULA_SAMPLES):
+        calculate_risk(index, random.uniform(min_lat, max_lat), random.uniform(min_lon, max_lon))
+    per_point = (time.perf_counter() - start) * 1e6 / FORMULA_SAMPLES
+    print(f"formula (one point per call): {per_point:.1f} us/point")
+
+print("\n✅ Benchmark complete")
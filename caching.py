@@ -0,0 +1,43 @@
+import os
+import hashlib
+
+from fastapi import Response
+
+# Seconds a client may reuse a response before revalidating it. The default of
+# 0 makes browsers revalidate every time, which is cheap because unchanged
+# data is answered with an empty 304.
+CACHE_MAX_AGE = int(os.getenv('CACHE_MAX_AGE', '0'))
+
+
+def make_etag(*parts):
+    """Build a strong ETag from the dataset version and any query parameters."""
+    raw = "|".join(str(p) for p in parts)
+    return '"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+
+def cache_headers(etag):
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CACHE_MAX_AGE}, must-revalidate",
+    }
+
+
+def etag_matches(request, etag):
+    """Return True if the request's If-None-Match header matches etag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(etag):
+    return Response(status_code=304, headers=cache_headers(etag))
+
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""Check that CrimeIndex.with_rows gives the same index as a full rebuild.
+
+Adds random batches to an index, some newer than everything indexed (the
+append path) and some reaching back in time (the merge path), and after
+each one compares columns, crime types, grid cells and cell histograms
+with a CrimeIndex built from scratch over all the rows so far. Needs no
+database or running API.
+"""
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from crime_index import CrimeIndex, to_timestamp
+
+BATCHES = 30
+BASE_ROWS = 5000
+TYPES = ["THEFT", "BATTERY", "ASSAULT", "ROBBERY", "BURGLARY", "NARCOTICS"]
+
+rng = np.random.default_rng(0)
+start = datetime(2023, 1, 1)
+next_id = 1
+
+
+def random_crimes(n, first_day, days, types=TYPES):
+    """n crimes around Chicago dated within `days` days from day `first_day`."""
+    global next_id
+    when = [
+        start + timedelta(days=int(d), hours=int(h), minutes=int(m))
+        for d, h, m in zip(
+            rng.integers(first_day, first_day + days, n), rng.integers(0, 24, n), rng.integers(0, 60, n)
+        )
+    ]
+    ids = list(range(next_id, next_id + n))
+    next_id += n
+    return pd.DataFrame({
+        "id": ids,
+        "latitude": 41.85 + rng.normal(0, 0.03, n),
+        "longitude": -87.65 + rng.normal(0, 0.03, n),
+        "severity": rng.integers(1, 6, n),
+        "crime_date": [w.strftime("%Y-%m-%d") for w in when],
+        "time": [w.strftime("%H:%M") for w in when],
+        "crime_type": rng.choice(types, n),
+    })
+
+
+def as_rows(df):
+    """Column dict in the form the ingest writer passes to with_rows."""
+    when = pd.to_datetime(df["crime_date"] + " " + df["time"])
+    return {
+        "ts": [to_timestamp(w.to_pydatetime()) for w in when],
+        "ids": df["id"].tolist(),
+        "lat": df["latitude"].tolist(),
+        "lon": df["longitude"].tolist(),
+        "severity": df["severity"].tolist(),
+        "hour": when.dt.hour.tolist(),
+        "crime_type": df["crime_type"].tolist(),
+    }
+
+
+def differences(merged, rebuilt):
+    """Names of the parts of the two indexes that disagree."""
+    found = []
+    for name in ("ts", "ids", "lat", "lon", "severity", "hour"):
+        if not np.array_equal(getattr(merged, name), getattr(rebuilt, name)):
+            found.append(name)
+    if merged.types.names != rebuilt.types.names or not np.array_equal(merged.type_code, rebuilt.type_code):
+        found.append("types")
+    if merged.cells.keys() != rebuilt.cells.keys() or any(
+        not np.array_equal(merged.cells[c], rebuilt.cells[c]) for c in rebuilt.cells
+    ):
+        found.append("cells")
+    for cell, expected in rebuilt.histograms.items():
+        hist = merged.histograms.get(cell)
+        # A cell's histogram may stop before types that never landed in it
+        if hist is None or not np.array_equal(hist, expected[:len(hist)]) or expected[len(hist):].any():
+            found.append("histograms")
+            break
+    return found
+
+
+# Batches bring crime types the first index hasn't seen
+df = random_crimes(BASE_ROWS, 0, 365, TYPES[:3])
+index = CrimeIndex(df)
+index.cells  # build the grid so batches are added to it incrementally
+first = index
+failures = 0
+
+for batch_no in range(BATCHES):
+    size = int(rng.integers(1, 400))
+    if batch_no % 3 == 0:
+        # Reaches back into indexed history: merged in
+        batch = random_crimes(size, 0, 365 + batch_no)
+    else:
+        # Newer than everything indexed: appended
+        batch = random_crimes(size, 365 + batch_no, 1)
+    index = index.with_rows(as_rows(batch))
+    df = pd.concat([df, batch], ignore_index=True)
+
+    found = differences(index, CrimeIndex(df))
+    if found:
+        failures += 1
+        print(f"❌ Batch {batch_no + 1} ({size} rows): {', '.join(found)} differ from a full rebuild")
+
+added = index.added_since(first)
+if added is None or sum(len(rows["ts"]) for rows in added) != len(df) - BASE_ROWS:
+    failures += 1
+    print("❌ added_since(first) doesn't return every batch added")
+
+if failures:
+    print(f"\n❌ {failures} check(s) failed")
+    sys.exit(1)
+print(f"✅ with_rows matches a full rebuild after each of {BATCHES} batches ({len(df)} rows)")
@@ -0,0 +1,366 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from database import engine
+from grid import cell_bounds, cells_covering, group_by_cell
+
+EARTH_RADIUS_KM = 6371
+# Size in degrees of the grid cells crimes are bucketed into (~1.1 km of latitude)
+CELL_DEG = 0.01
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Vectorized great-circle distance in km from one point to arrays of points."""
+    lat1 = np.radians(lat)
+    lats = np.radians(lats)
+    dlat = lats - lat1
+    dlon = np.radians(lons - lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def to_timestamp(at):
+    """Seconds since the epoch for a naive datetime, matching the index's ts column."""
+    return int(pd.Timestamp(at).value // 10**9)
+
+
+def cell_intersects(cell, lat, lon, radius_km):
+    """Whether a grid cell intersects the circle of radius_km around (lat, lon)."""
+    # Nearest point of the cell to the centre decides
+    min_lat, min_lon, max_lat, max_lon = cell_bounds(cell, CELL_DEG)
+    near_lat = min(max(lat, min_lat), max_lat)
+    near_lon = min(max(lon, min_lon), max_lon)
+    return haversine_km(lat, lon, near_lat, near_lon) <= radius_km
+
+
+# Column name -> dtype of every CrimeIndex column
+COLUMNS = {
+    "ts": np.int64,
+    "ids": np.int64,
+    "lat": np.float64,
+    "lon": np.float64,
+    "severity": np.float64,
+    "hour": np.int8,
+    "type_code": np.int32,
+}
+
+# Per-cell histograms count crimes by type code x severity (1-5) x hour of day
+SEVERITY_LEVELS = 5
+HOURS = 24
+# Batches an index remembers from with_rows, for ``added_since``
+RECENT_BATCHES = 64
+
+
+class TypeDictionary:
+    """Append-only crime_type <-> integer code mapping shared by index snapshots.
+
+    Snapshots only hold codes that existed when they were built, so codes
+    added later for new types never change what an older snapshot sees.
+    """
+
+    def __init__(self, names=()):
+        self.names = list(names)
+        self._codes = {name: code for code, name in enumerate(self.names)}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def encode(self, names):
+        with self._lock:
+            codes = []
+            for name in names:
+                code = self._codes.get(name)
+                if code is None:
+                    name = str(name)
+                    code = self._codes[name] = len(self.names)
+                    self.names.append(name)
+                codes.append(code)
+        return np.array(codes, dtype=np.int32)
+
+
+class CrimeIndex:
+    """Crime records held as numpy columns sorted by timestamp.
+
+    Dates are parsed once when the index is built, so any time window is a
+    pair of binary searches on ``ts`` and a slice of the other columns.
+    Rows without coordinates or a parseable date are dropped.
+
+    An index is never modified once built: ``with_rows`` returns a new index,
+    so a request keeps a consistent snapshot while ingestion carries on.
+    Columns are views into buffers with spare capacity, which makes the
+    common case of appending the newest crimes O(batch) instead of O(n).
+
+    Crime types are dictionary-encoded in ``type_code`` (names in
+    ``types.names``). Rows are also bucketed into grid cells, each with a
+    type x severity x hour histogram, so neighbourhood breakdowns are a sum
+    of a few small arrays.
+
+    Each index also remembers the last RECENT_BATCHES batches added by
+    ``with_rows``, so readers keeping their own aggregates can apply just
+    the new rows (see ``added_since``).
+    """
+
+    def __init__(self, df):
+        dates = pd.to_datetime(df["crime_date"], format="mixed", errors="coerce")
+        clock = df["time"].fillna("12:00").astype(str)  # HH:MM
+        hours = pd.to_numeric(clock.str[:2], errors="coerce").fillna(12).clip(0, 23)
+        minutes = pd.to_numeric(clock.str[3:5], errors="coerce").fillna(0).clip(0, 59)
+        ts = dates + pd.to_timedelta(hours * 3600 + minutes * 60, unit="s")
+
+        keep = ts.notna() & df["latitude"].notna() & df["longitude"].notna()
+        ts = ts[keep].astype("datetime64[s]").astype(np.int64).to_numpy()
+        order = np.argsort(ts, kind="stable")
+        codes, names = pd.factorize(df["crime_type"][keep].fillna("Unknown"))
+        self.types = TypeDictionary(names)
+
+        self._attach({
+            "ts": ts[order],
+            "ids": df["id"][keep].to_numpy(dtype=np.int64)[order],
+            "lat": df["latitude"][keep].to_numpy(dtype=np.float64)[order],
+            "lon": df["longitude"][keep].to_numpy(dtype=np.float64)[order],
+            "severity": df["severity"][keep].fillna(1).to_numpy(dtype=np.float64)[order],
+            "hour": hours[keep].to_numpy(dtype=np.int8)[order],
+            "type_code": codes.astype(np.int32)[order],
+        }, int(keep.sum()))
+        self._build_cells()
+
+    def _attach(self, buffers, n):
+        self._buffers = buffers
+        self._n = n
+        for name in COLUMNS:
+            setattr(self, name, buffers[name][:n])
+        self.max_id = int(self.ids.max()) if n else 0
+        self._cells = None
+        self._histograms = None
+        self._cell_severity = {}
+        # (token shared by every index derived from the same build, batches added since)
+        self._lineage = (object(), 0)
+        self._batches = ()
+
+    @classmethod
+    def _from_buffers(cls, buffers, n, types):
+        index = cls.__new__(cls)
+        index.types = types
+        index._attach(buffers, n)
+        return index
+
+    def _histogram_keys(self, positions):
+        """Flat histogram bin of each row: (type, severity, hour) in C order."""
+        severity = np.clip(self.severity[positions], 1, SEVERITY_LEVELS).astype(np.int64) - 1
+        return (self.type_code[positions].astype(np.int64) * SEVERITY_LEVELS + severity) * HOURS + self.hour[positions]
+
+    def histogram(self, positions, base=None):
+        """Type x severity x hour histogram of the rows at positions, plus base (which may have fewer types)."""
+        n_types = len(self.types)
+        width = n_types * SEVERITY_LEVELS * HOURS
+        hist = np.bincount(self._histogram_keys(positions), minlength=width).astype(np.int32)
+        hist = hist.reshape(n_types, SEVERITY_LEVELS, HOURS)
+        if base is not None:
+            hist[:len(base)] += base
+        return hist
+
+    def _build_cells(self):
+        self._cells = group_by_cell(self.lat, self.lon, CELL_DEG)
+        self._histograms = {cell: self.histogram(positions) for cell, positions in self._cells.items()}
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def nbytes(self):
+        """Approximate memory held: column buffers plus grid cells and histograms once built."""
+        total = sum(buffer.nbytes for buffer in self._buffers.values())
+        if self._cells is not None:
+            total += sum(positions.nbytes for positions in self._cells.values())
+            total += sum(hist.nbytes for hist in self._histograms.values())
+        return total
+
+    def with_rows(self, rows):
+        """Return a new index that also contains ``rows``.
+
+        ``rows`` is a dict of column arrays, with crime type names under
+        ``crime_type`` instead of ``type_code``.
+
+        Rows newer than everything indexed are written into spare buffer
+        capacity past this index's end, which existing snapshots never see.
+        Older rows are merged in at their sorted positions.
+        """
+        rows = dict(rows, type_code=self.types.encode(rows["crime_type"]))
+        new = {name: np.asarray(rows[name], dtype=dtype) for name, dtype in COLUMNS.items()}
+        k = len(new["ts"])
+        if k == 0:
+            return self
+        order = np.argsort(new["ts"], kind="stable")
+        new = {name: col[order] for name, col in new.items()}
+
+        n = self._n
+        if n == 0 or new["ts"][0] >= self.ts[-1]:
+            buffers = self._buffers
+            if n + k > len(buffers["ts"]):
+                capacity = max(2 * len(buffers["ts"]), n + k, 1024)
+                grown = {}
+                for name, dtype in COLUMNS.items():
+                    grown[name] = np.empty(capacity, dtype=dtype)
+                    grown[name][:n] = buffers[name][:n]
+                buffers = grown
+            for name in COLUMNS:
+                buffers[name][n:n + k] = new[name]
+            index = CrimeIndex._from_buffers(buffers, n + k, self.types)
+            if self._cells is not None:
+                # Positions of existing rows are unchanged, so only the cells
+                # that received rows need new arrays
+                index._add_to_cells(dict(self._cells), new, np.arange(n, n + k, dtype=np.int64), self._histograms)
+            return self._derived(index, new)
+
+        positions = np.searchsorted(self.ts, new["ts"], side="right")
+        merged = {name: np.insert(getattr(self, name), positions, new[name]) for name in COLUMNS}
+        index = CrimeIndex._from_buffers(merged, n + k, self.types)
+        if self._cells is not None:
+            # Existing rows move up by the number of new rows inserted before
+            # them; their histograms don't depend on positions and carry over
+            cells = {cell: p + np.searchsorted(positions, p, side="right") for cell, p in self._cells.items()}
+            index._add_to_cells(cells, new, positions + np.arange(k), self._histograms)
+        return self._derived(index, new)
+
+    def _add_to_cells(self, cells, new, positions, histograms):
+        """Take over the cells and histograms of the index this one was derived from,
+        adding the rows of ``new`` now at ``positions``.
+        """
+        histograms = dict(histograms)
+        for cell, added in group_by_cell(new["lat"], new["lon"], CELL_DEG, positions).items():
+            existing = cells.get(cell)
+            if existing is None:
+                cells[cell] = added
+            else:
+                combined = np.concatenate([existing, added])
+                if len(existing) and added[0] < existing[-1]:
+                    combined.sort(kind="stable")
+                cells[cell] = combined
+            histograms[cell] = self.histogram(added, histograms.get(cell))
+        self._cells = cells
+        self._histograms = histograms
+
+    def _derived(self, index, new):
+        token, added = self._lineage
+        index._lineage = (token, added + 1)
+        index._batches = (self._batches + (new,))[-RECENT_BATCHES:]
+        return index
+
+    def added_since(self, older):
+        """Column dicts of the batches added to ``older`` to make this index, oldest first.
+
+        Returns None when this index doesn't derive from ``older`` by
+        ``with_rows`` or too many batches have been added since.
+        """
+        token, added = self._lineage
+        older_token, older_added = older._lineage
+        behind = added - older_added
+        if token is not older_token or not 0 <= behind <= len(self._batches):
+            return None
+        return self._batches[len(self._batches) - behind:]
+
+    @property
+    def cells(self):
+        """Grid cell -> ascending row positions of the crimes in it."""
+        if self._cells is None:
+            self._build_cells()
+        return self._cells
+
+    @property
+    def histograms(self):
+        """Grid cell -> int32 array of crime counts, shape (types, SEVERITY_LEVELS, HOURS).
+
+        A cell's array may cover fewer types than ``types`` if no crime of a
+        newer type has landed in it.
+        """
+        if self._histograms is None:
+            self._build_cells()
+        return self._histograms
+
+    def profile(self, lat, lon, radius_km, cold=None):
+        """Summed histograms of the grid cells intersecting the circle around (lat, lon).
+
+        Cells on the edge are counted whole, so this is an approximation at
+        cell resolution of the crimes within radius_km. ``cold`` optionally
+        adds the archived crimes of the same cells from a ColdSummary.
+        """
+        # Archived types are mapped to this index's codes, adding any it lacks
+        cold_codes = self.types.encode(cold.type_names) if cold is not None and cold.histograms else None
+        total = np.zeros((len(self.types), SEVERITY_LEVELS, HOURS), dtype=np.int64)
+        histograms = self.histograms
+        for cell in cells_covering(lat, lon, radius_km, CELL_DEG):
+            hist = histograms.get(cell)
+            cold_hist = cold.histograms.get(cell) if cold_codes is not None else None
+            if (hist is None and cold_hist is None) or not cell_intersects(cell, lat, lon, radius_km):
+                continue
+            if hist is not None:
+                total[:len(hist)] += hist
+            if cold_hist is not None:
+                total[cold_codes] += cold_hist
+        return total
+
+    def cell_severity(self, cell):
+        """Sum of severities of all crimes in a grid cell."""
+        total = self._cell_severity.get(cell)
+        if total is None:
+            positions = self.cells.get(cell)
+            total = float(self.severity[positions].sum()) if positions is not None else 0.0
+            self._cell_severity[cell] = total
+        return total
+
+    def window(self, start=None, end=None):
+        """Return the slice of rows with start < ts <= end (either bound may be None)."""
+        lo = 0 if start is None else int(np.searchsorted(self.ts, start, side="right"))
+        hi = len(self.ts) if end is None else int(np.searchsorted(self.ts, end, side="right"))
+        return slice(lo, hi)
+
+    def nearby(self, lat, lon, radius_km, rows=slice(None)):
+        """Return absolute row positions within radius_km of (lat, lon), restricted to rows."""
+        lats = self.lat[rows]
+        lons = self.lon[rows]
+        # Cheap bounding-box prefilter before the trigonometry
+        dlat = radius_km / 111.0
+        dlon = radius_km / (111.0 * max(np.cos(np.radians(lat)), 0.01))
+        box = np.nonzero((np.abs(lats - lat) <= dlat) & (np.abs(lons - lon) <= dlon))[0]
+        if len(box):
+            box = box[haversine_km(lat, lon, lats[box], lons[box]) <= radius_km]
+        start = rows.start or 0
+        return box + start
+
+
+def bbox_clause(bbox, exclude=()):
+    """SQL condition and parameters restricting latitude/longitude to bbox (or everything if None)
+    and to outside every bounding box in exclude.
+    """
+    clauses, params = [], {}
+    for prefix, box in [("", bbox)] + [(f"x{i}_", box) for i, box in enumerate(exclude)]:
+        if box is None:
+            continue
+        clause = (
+            f"latitude BETWEEN :{prefix}min_lat AND :{prefix}max_lat AND "
+            f"longitude BETWEEN :{prefix}min_lon AND :{prefix}max_lon"
+        )
+        clauses.append(f"NOT ({clause})" if prefix else clause)
+        params.update(zip(
+            (f"{prefix}min_lat", f"{prefix}min_lon", f"{prefix}max_lat", f"{prefix}max_lon"), box
+        ))
+    return " AND ".join(clauses) or "1 = 1", params
+
+
+def load_index(bbox=None, exclude=()):
+    """Build an index from crime_records in bbox (outside exclude) and return it with the dataset version it reflects."""
+    where, params = bbox_clause(bbox, exclude)
+    with engine.connect() as conn:
+        # Version first: a commit landing in between only adds rows, which
+        # apply_rows later recognizes by id and skips.
+        version = conn.execute(text("SELECT version FROM dataset_meta WHERE id = 1")).scalar() or 0
+        df = pd.read_sql(
+            text(f"SELECT id, latitude, longitude, severity, crime_date, time, crime_type FROM crime_records WHERE {where}"),
+            conn,
+            params=params
+        )
+    return CrimeIndex(df), version
@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from database import SessionLocal
+from models import DatasetMeta
+
+# Every process that writes crime_records bumps this version in the same
+# transaction as its data change. The API caches the value in memory and only
+# re-reads it from the database every VERSION_TTL seconds, so cache validation
+# (ETag / If-None-Match) never needs a query of its own.
+VERSION_TTL = float(os.getenv('DATASET_VERSION_TTL', '2'))
+
+_lock = threading.Lock()
+_version = None
+_checked_at = 0.0
+
+
+def _read_version():
+    db = SessionLocal()
+    try:
+        meta = db.query(DatasetMeta).filter(DatasetMeta.id == 1).first()
+        return meta.version if meta else 0
+    finally:
+        db.close()
+
+
+def bump_version(session):
+    """Increment the crime dataset version inside the caller's transaction.
+
+    The caller commits. Returns the new version number.
+    """
+    updated = session.query(DatasetMeta).filter(DatasetMeta.id == 1).update(
+        {DatasetMeta.version: DatasetMeta.version + 1, DatasetMeta.updated_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+    if not updated:
+        session.add(DatasetMeta(id=1, version=1, updated_at=datetime.utcnow()))
+    session.flush()
+    return session.query(DatasetMeta.version).filter(DatasetMeta.id == 1).scalar()
+
+
+def set_version(version):
+    """Record a version committed by this process so readers see it immediately."""
+    global _version, _checked_at
+    with _lock:
+        if _version is None or version > _version:
+            _version = version
+        _checked_at = time.monotonic()
+
+
+def current_version():
+    """Return the crime dataset version, refreshed from the database at most every VERSION_TTL seconds."""
+    global _version, _checked_at
+    now = time.monotonic()
+    if _version is not None and now - _checked_at < VERSION_TTL:
+        return _version
+    with _lock:
+        if _version is None or now - _checked_at >= VERSION_TTL:
+            try:
+                stored = _read_version()
+            except Exception:
+                stored = _version or 0
+            _version = stored if _version is None else max(_version, stored)
+            _checked_at = now
+        return _version
@@ -0,0 +1,178 @@
+import math
+import os
+
+import numpy as np
+
+from crime_index import CELL_DEG
+
+# Where train_model.py writes the per-cell features the API serves from
+FEATURE_STORE_PATH = os.getenv('FEATURE_STORE_PATH', 'feature_store.npz')
+
+# Look-back windows of the per-cell crime counts
+WINDOWS_DAYS = (7, 30, 90, 365)
+# Column of count_all in the per-cell sums
+COUNT_ALL = len(WINDOWS_DAYS)
+# Crime types with their own share feature; the rest count as "other"
+TOP_TYPES = 8
+# Hour profile resolution: 4 parts of 6 hours from midnight
+DAY_PARTS = 4
+
+
+def sum_names(vocab):
+    """Names of the per-cell sums, in column order. All are additive across cells."""
+    return (
+        [f"count_{d}d" for d in WINDOWS_DAYS] +
+        ["count_all", "severity_sum", "severity_sq_sum", "severe_count"] +
+        [f"type:{t}" for t in vocab] + ["type:other"] +
+        [f"hours_{p * 24 // DAY_PARTS:02d}" for p in range(DAY_PARTS)]
+    )
+
+
+def grid_shape(bbox):
+    """(first row, first col, rows, cols) of the CELL_DEG grid covering bbox."""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    r0, c0 = math.floor(min_lat / CELL_DEG), math.floor(min_lon / CELL_DEG)
+    return r0, c0, math.floor(max_lat / CELL_DEG) - r0 + 1, math.floor(max_lon / CELL_DEG) - c0 + 1
+
+
+def cell_centres(bbox):
+    """Latitudes and longitudes of the centres of the grid cells covering bbox, row-major."""
+    r0, c0, n_rows, n_cols = grid_shape(bbox)
+    rows, cols = np.meshgrid(np.arange(n_rows), np.arange(n_cols), indexing="ij")
+    return (rows.ravel() + r0 + 0.5) * CELL_DEG, (cols.ravel() + c0 + 0.5) * CELL_DEG
+
+
+def _flat_cells(lat, lon, r0, c0, n_rows, n_cols):
+    """Row-major grid cell of each point, and which of them fall inside the grid."""
+    r = np.floor(np.asarray(lat, dtype=np.float64) / CELL_DEG).astype(np.int64) - r0
+    c = np.floor(np.asarray(lon, dtype=np.float64) / CELL_DEG).astype(np.int64) - c0
+    keep = (r >= 0) & (r < n_rows) & (c >= 0) & (c < n_cols)
+    return (r * n_cols + c)[keep], keep
+
+
+def _sums(flat, ts, severity, type_slot, hour, at_ts, n_vocab, n):
+    """(n, F) per-cell sums of crimes already assigned to flat cells and type slots."""
+    part = np.asarray(hour, dtype=np.int64) * DAY_PARTS // 24
+    columns = [np.bincount(flat[ts > at_ts - d * 86400], minlength=n) for d in WINDOWS_DAYS]
+    columns += [
+        np.bincount(flat, minlength=n),
+        np.bincount(flat, weights=severity, minlength=n),
+        np.bincount(flat, weights=severity ** 2, minlength=n),
+        np.bincount(flat[severity >= 4], minlength=n),
+    ]
+    types = np.bincount(flat * (n_vocab + 1) + type_slot, minlength=n * (n_vocab + 1)).reshape(n, -1)
+    hours = np.bincount(flat * DAY_PARTS + part, minlength=n * DAY_PARTS).reshape(n, -1)
+    return np.column_stack(columns + [types, hours]).astype(np.float32)
+
+
+def cell_counts(index, start_ts, end_ts, bbox):
+    """Crimes per cell with start_ts < ts <= end_ts, as a (rows, cols, 1) grid."""
+    r0, c0, n_rows, n_cols = grid_shape(bbox)
+    rows = index.window(start_ts, end_ts)
+    flat, _ = _flat_cells(index.lat[rows], index.lon[rows], r0, c0, n_rows, n_cols)
+    return np.bincount(flat, minlength=n_rows * n_cols).astype(np.float32).reshape(n_rows, n_cols, 1)
+
+
+def cell_sums(index, at_ts, vocab, bbox):
+    """Per-cell sums (see ``sum_names``) of the crimes in index up to at_ts, as a (rows, cols, F) grid."""
+    r0, c0, n_rows, n_cols = grid_shape(bbox)
+    rows = index.window(None, at_ts)
+    flat, keep = _flat_cells(index.lat[rows], index.lon[rows], r0, c0, n_rows, n_cols)
+    slots = {name: i for i, name in enumerate(vocab)}
+    slot_of_code = np.array([slots.get(name, len(vocab)) for name in index.types.names], dtype=np.int64)
+    type_slot = slot_of_code[index.type_code[rows][keep]] if len(slot_of_code) else np.zeros(0, dtype=np.int64)
+    sums = _sums(
+        flat, index.ts[rows][keep], index.severity[rows][keep], type_slot, index.hour[rows][keep],
+        at_ts, len(vocab), n_rows * n_cols
+    )
+    return sums.reshape(n_rows, n_cols, -1)
+
+
+class FeatureGrid:
+    """Per-cell sums of one region with a summed-area table for neighbourhood queries.
+
+    The sum over any rectangle of cells is four lookups, so the
+    neighbourhoods of a whole batch of points are a handful of numpy ops.
+    """
+
+    def __init__(self, r0, c0, sums):
+        self.r0 = r0
+        self.c0 = c0
+        self.sums = sums
+        n_rows, n_cols, n_features = sums.shape
+        self._table = np.zeros((n_rows + 1, n_cols + 1, n_features), dtype=np.float64)
+        self._table[1:, 1:] = sums.astype(np.float64).cumsum(axis=0).cumsum(axis=1)
+
+    def neighbourhood(self, lats, lons, radius_km):
+        """(n, F) sums over the cells covering the bounding box of radius_km around each point."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        n_rows, n_cols = self.sums.shape[:2]
+        dlat = radius_km / 111.0
+        dlon = radius_km / (111.0 * np.maximum(np.cos(np.radians(lats)), 0.01))
+        r_lo = np.clip(np.floor((lats - dlat) / CELL_DEG).astype(np.int64) - self.r0, 0, n_rows)
+        r_hi = np.clip(np.floor((lats + dlat) / CELL_DEG).astype(np.int64) - self.r0 + 1, 0, n_rows)
+        c_lo = np.clip(np.floor((lons - dlon) / CELL_DEG).astype(np.int64) - self.c0, 0, n_cols)
+        c_hi = np.clip(np.floor((lons + dlon) / CELL_DEG).astype(np.int64) - self.c0 + 1, 0, n_cols)
+        t = self._table
+        return t[r_hi, c_hi] - t[r_lo, c_hi] - t[r_hi, c_lo] + t[r_lo, c_lo]
+
+    def with_rows(self, rows, at_ts, vocab):
+        """A new grid that also counts ``rows``, with look-back windows as of at_ts.
+
+        ``rows`` is a dict of column arrays as passed to CrimeIndex.with_rows.
+        Rows newer than at_ts count in every window.
+        """
+        n_rows, n_cols = self.sums.shape[:2]
+        flat, keep = _flat_cells(rows["lat"], rows["lon"], self.r0, self.c0, n_rows, n_cols)
+        if not len(flat):
+            return self
+        slots = {name: i for i, name in enumerate(vocab)}
+        type_slot = np.array([slots.get(name, len(vocab)) for name in np.asarray(rows["crime_type"])[keep]], dtype=np.int64)
+        added = _sums(
+            flat, np.asarray(rows["ts"], dtype=np.int64)[keep], np.asarray(rows["severity"], dtype=np.float64)[keep],
+            type_slot, np.asarray(rows["hour"])[keep], at_ts, len(vocab), n_rows * n_cols
+        )
+        return FeatureGrid(self.r0, self.c0, self.sums + added.reshape(self.sums.shape))
+
+
+def derive(sums, vocab):
+    """Model inputs from neighbourhood sums: log counts, severity stats, type and hour shares."""
+    n_windows = COUNT_ALL
+    counts = sums[:, :n_windows]
+    total, severity_sum, severity_sq, severe = (sums[:, n_windows + i] for i in range(4))
+    types = sums[:, n_windows + 4:n_windows + 4 + len(vocab) + 1]
+    hours = sums[:, n_windows + 5 + len(vocab):]
+    n = np.maximum(total, 1)[:, None]
+    mean = severity_sum / n[:, 0]
+    return np.column_stack([
+        np.log1p(counts),
+        np.log1p(total),
+        mean,
+        np.sqrt(np.maximum(severity_sq / n[:, 0] - mean ** 2, 0)),
+        severe / n[:, 0],
+        counts[:, 1] / np.maximum(counts[:, 3], 1),  # last 30 days vs last year
+        types / n,
+        hours / n,
+    ]).astype(np.float32)
+
+
+def save_store(path, grids, vocab, built_at, version):
+    """Write {region: FeatureGrid} with the type vocabulary to one .npz file."""
+    arrays = {"vocab": np.array(vocab, dtype=str), "built_at": np.array(built_at), "version": np.array(version)}
+    for region, grid in grids.items():
+        arrays[f"{region}.sums"] = grid.sums
+        arrays[f"{region}.origin"] = np.array([grid.r0, grid.c0])
+    np.savez_compressed(path, **arrays)
+
+
+def load_store(path=FEATURE_STORE_PATH):
+    """Read a store written by save_store: ({region: FeatureGrid}, vocab, built_at, version)."""
+    with np.load(path) as data:
+        grids = {}
+        for key in data.files:
+            if key.endswith(".sums"):
+                region = key[:-len(".sums")]
+                r0, c0 = data[f"{region}.origin"].tolist()
+                grids[region] = FeatureGrid(r0, c0, data[key])
+        return grids, data["vocab"].tolist(), str(data["built_at"]), int(data["version"])
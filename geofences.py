@@ -0,0 +1,270 @@
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import func, insert, select, text
+
+import sms as sms_module
+from crime_index import haversine_km
+from database import engine, SessionLocal
+from grid import cells_covering, group_by_cell
+from models import Geofence, GeofenceAlert
+
+# Grid cell size in degrees for the fence index. Coarser than the crime grid
+# so that a typical fence of a few km sits in only a handful of cells.
+GEOFENCE_CELL_DEG = 0.02
+# Committed crimes are matched and alerts sent at most this often, so each
+# fence gets at most one SMS per interval
+NOTIFY_INTERVAL = float(os.getenv('GEOFENCE_NOTIFY_INTERVAL', '5'))
+# Crimes waiting to be matched; beyond this the oldest are dropped
+MAX_PENDING = int(os.getenv('GEOFENCE_MAX_PENDING', '100000'))
+
+
+def points_in_polygon(lats, lons, polygon):
+    """Even-odd rule test of points against a polygon given as an (n, 2) array of (lat, lon)."""
+    inside = np.zeros(len(lats), dtype=bool)
+    plat, plon = polygon[:, 0], polygon[:, 1]
+    j = len(polygon) - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i in range(len(polygon)):
+            crosses = (plat[i] > lats) != (plat[j] > lats)
+            edge_lon = (plon[j] - plon[i]) * (lats - plat[i]) / (plat[j] - plat[i]) + plon[i]
+            inside ^= crosses & (lons < edge_lon)
+            j = i
+    return inside
+
+
+def next_revision():
+    """Statement assigning the next fence revision, evaluated inside the INSERT/UPDATE itself."""
+    return select(func.coalesce(func.max(Geofence.revision), 0) + 1).scalar_subquery()
+
+
+class GeofenceIndex:
+    """Reverse spatial index: grid cell -> the fences that touch it.
+
+    A crime only needs checking against the fences of its own cell, so
+    matching costs depend on how many fences overlap a point, not on how
+    many exist. Each cell keeps numpy arrays of its circles for a
+    vectorized distance test; polygons are tested one by one.
+    """
+
+    def __init__(self, cell_deg=GEOFENCE_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.revision = 0
+        self._fences = {}  # id -> (lat, lon, radius_km, polygon array or None, min_severity, cells, contact)
+        self._cells = {}  # cell -> set of fence ids
+        self._arrays = {}  # cell -> cached arrays of the cell's fences
+
+    def __len__(self):
+        return len(self._fences)
+
+    def add(self, fence_id, lat=None, lon=None, radius_km=None, polygon=None, min_severity=1, contact=None):
+        """Add or replace a fence. ``contact`` is any value to hand back from ``contact()``."""
+        self.remove(fence_id)
+        if polygon is not None:
+            polygon = np.asarray(polygon, dtype=np.float64)
+            min_lat, min_lon = polygon.min(axis=0)
+            max_lat, max_lon = polygon.max(axis=0)
+            rows = range(int(np.floor(min_lat / self.cell_deg)), int(np.floor(max_lat / self.cell_deg)) + 1)
+            cols = range(int(np.floor(min_lon / self.cell_deg)), int(np.floor(max_lon / self.cell_deg)) + 1)
+            cells = [(r, c) for r in rows for c in cols]
+        else:
+            cells = cells_covering(lat, lon, radius_km, self.cell_deg)
+        self._fences[fence_id] = (lat, lon, radius_km, polygon, min_severity, cells, contact)
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(fence_id)
+            self._arrays.pop(cell, None)
+
+    def remove(self, fence_id):
+        fence = self._fences.pop(fence_id, None)
+        if fence is None:
+            return
+        for cell in fence[5]:
+            ids = self._cells[cell]
+            ids.discard(fence_id)
+            if not ids:
+                del self._cells[cell]
+            self._arrays.pop(cell, None)
+
+    def contact(self, fence_id):
+        fence = self._fences.get(fence_id)
+        return fence[6] if fence else None
+
+    def _cell_arrays(self, cell):
+        arrays = self._arrays.get(cell)
+        if arrays is None:
+            fences = [(i, self._fences[i]) for i in sorted(self._cells[cell])]
+            circles = [(i, f) for i, f in fences if f[3] is None]
+            polygons = [(i, f) for i, f in fences if f[3] is not None]
+            arrays = self._arrays[cell] = (
+                np.array([i for i, _ in circles], dtype=np.int64),
+                np.array([f[0] for _, f in circles], dtype=np.float64),
+                np.array([f[1] for _, f in circles], dtype=np.float64),
+                np.array([f[2] for _, f in circles], dtype=np.float64),
+                np.array([f[4] for _, f in circles], dtype=np.float64),
+                [(i, f[3], f[4]) for i, f in polygons],
+                # Polygon bounding boxes (min_lat, min_lon, max_lat, max_lon), one row each
+                np.array([np.r_[f[3].min(axis=0), f[3].max(axis=0)] for _, f in polygons]).reshape(-1, 4),
+            )
+        return arrays
+
+    def match(self, lats, lons, severities):
+        """Return (positions, fence_ids) of every crime/fence pair where the crime is inside the fence."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        severities = np.asarray(severities, dtype=np.float64)
+        found_positions, found_ids = [], []
+        for cell, positions in group_by_cell(lats, lons, self.cell_deg).items():
+            if cell not in self._cells:
+                continue
+            ids, c_lat, c_lon, c_radius, c_severity, polygons, boxes = self._cell_arrays(cell)
+            p_lat, p_lon, p_severity = lats[positions], lons[positions], severities[positions]
+            if len(ids):
+                inside = haversine_km(p_lat[:, None], p_lon[:, None], c_lat[None, :], c_lon[None, :]) <= c_radius
+                inside &= p_severity[:, None] >= c_severity[None, :]
+                rows, cols = np.nonzero(inside)
+                found_positions.append(positions[rows])
+                found_ids.append(ids[cols])
+            if polygons:
+                # Only polygons whose bounding box holds some crime get the exact test
+                in_box = (
+                    (p_lat[:, None] >= boxes[:, 0]) & (p_lat[:, None] <= boxes[:, 2]) &
+                    (p_lon[:, None] >= boxes[:, 1]) & (p_lon[:, None] <= boxes[:, 3])
+                )
+                for k in np.flatnonzero(in_box.any(axis=0)).tolist():
+                    fence_id, polygon, min_severity = polygons[k]
+                    candidates = np.flatnonzero(in_box[:, k])
+                    inside = points_in_polygon(p_lat[candidates], p_lon[candidates], polygon)
+                    inside &= p_severity[candidates] >= min_severity
+                    found_positions.append(positions[candidates[inside]])
+                    found_ids.append(np.full(int(inside.sum()), fence_id, dtype=np.int64))
+        if not found_positions:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(found_positions), np.concatenate(found_ids)
+
+    def sync(self, conn):
+        """Apply fences created or deactivated since the last sync, with (name, phone) as contact."""
+        rows = conn.execute(
+            text(
+                "SELECT id, name, latitude, longitude, radius_m, polygon, phone, min_severity, active, revision "
+                "FROM geofences WHERE revision > :revision ORDER BY revision"
+            ),
+            {"revision": self.revision}
+        ).fetchall()
+        for r in rows:
+            if r.active:
+                polygon = json.loads(r.polygon) if r.polygon else None
+                radius_km = r.radius_m / 1000 if r.radius_m else None
+                self.add(r.id, r.latitude, r.longitude, radius_km, polygon, r.min_severity or 1, (r.name, r.phone))
+            else:
+                self.remove(r.id)
+            self.revision = max(self.revision, r.revision)
+
+
+class GeofenceNotifier:
+    """Background thread matching committed crimes against geofences.
+
+    The ingest writer only hands over its committed rows, so ingestion never
+    waits on matching or delivery. Every NOTIFY_INTERVAL the thread syncs
+    fence changes, matches everything pending in one pass, stores an alert
+    per match and sends one SMS per fence that has a phone number.
+    """
+
+    def __init__(self, interval=NOTIFY_INTERVAL, max_pending=MAX_PENDING):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.index = GeofenceIndex()
+        self.matched = 0
+        self.dropped = 0
+        self.sms_failed = 0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def submit(self, rows):
+        """Queue committed crimes, given as the column dict passed to RegionCache.apply_rows."""
+        crimes = list(zip(rows["ids"], rows["lat"], rows["lon"], rows["severity"], rows["ts"], rows["crime_type"]))
+        with self._cond:
+            overflow = len(self._pending) + len(crimes) - self.max_pending
+            for _ in range(max(0, overflow)):
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.extend(crimes)
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="geofence-notifier", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=10):
+        """Match whatever is pending and stop the thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping:
+                    self._cond.wait(self.interval)
+                crimes = list(self._pending)
+                self._pending.clear()
+                stopping = self._stopping
+            if crimes:
+                try:
+                    self._notify(crimes)
+                except Exception as e:
+                    print(f"❌ Geofence matching failed for {len(crimes)} crimes: {e}")
+            if stopping:
+                return
+
+    def _notify(self, crimes):
+        with engine.connect() as conn:
+            self.index.sync(conn)
+        ids, lats, lons, severities, ts, types = zip(*crimes)
+        positions, fence_ids = self.index.match(lats, lons, severities)
+        if not len(positions):
+            return
+
+        alerts = [
+            {
+                "geofence_id": int(fence_id),
+                "crime_id": int(ids[p]),
+                "crime_type": types[p],
+                "severity": int(severities[p]),
+                "latitude": float(lats[p]),
+                "longitude": float(lons[p]),
+                "occurred_at": datetime.fromtimestamp(int(ts[p]), timezone.utc).replace(tzinfo=None),
+            }
+            for p, fence_id in zip(positions.tolist(), fence_ids.tolist())
+        ]
+        db = SessionLocal()
+        try:
+            db.execute(insert(GeofenceAlert), alerts)
+            db.commit()
+        finally:
+            db.close()
+        self.matched += len(alerts)
+
+        by_fence = {}
+        for alert in alerts:
+            by_fence.setdefault(alert["geofence_id"], []).append(alert)
+        for fence_id, fence_alerts in by_fence.items():
+            name, phone = self.index.contact(fence_id) or (None, None)
+            if not phone:
+                continue
+            types = sorted({a["crime_type"] for a in fence_alerts})
+            message = f"⚠️ {len(fence_alerts)} crime(s) reported near {name}: {', '.join(types[:5])}"
+            try:
+                sms_module.send_sms(phone, message)
+            except Exception as e:
+                self.sms_failed += 1
+                print(f"❌ Geofence SMS to fence {fence_id} failed: {e}")
+
+
+geofence_notifier = GeofenceNotifier()
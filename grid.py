@@ -0,0 +1,43 @@
+import math
+
+import numpy as np
+
+KM_PER_DEG_LAT = 111.0
+
+
+def cell_of(lat, lon, size):
+    """Grid cell (row, col) containing a point, for cells of ``size`` degrees."""
+    return (math.floor(lat / size), math.floor(lon / size))
+
+
+def cells_covering(lat, lon, radius_km, size):
+    """All grid cells intersecting the bounding box of a circle around (lat, lon)."""
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlon = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 0.01))
+    r0, c0 = cell_of(lat - dlat, lon - dlon, size)
+    r1, c1 = cell_of(lat + dlat, lon + dlon, size)
+    return [(r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+
+def group_by_cell(lats, lons, size, positions=None):
+    """Map each grid cell to the array of positions whose point falls in it.
+
+    Positions keep their input order within a cell.
+    """
+    if positions is None:
+        positions = np.arange(len(lats), dtype=np.int64)
+    if len(positions) == 0:
+        return {}
+    rows = np.floor(lats / size).astype(np.int64)
+    cols = np.floor(lons / size).astype(np.int64)
+    order = np.lexsort((cols, rows))
+    rows, cols, positions = rows[order], cols[order], positions[order]
+    starts = np.flatnonzero(np.r_[True, (np.diff(rows) != 0) | (np.diff(cols) != 0)])
+    ends = np.r_[starts[1:], len(positions)]
+    return {(int(rows[s]), int(cols[s])): positions[s:e] for s, e in zip(starts.tolist(), ends.tolist())}
+
+
+def cell_bounds(cell, size):
+    """(min_lat, min_lon, max_lat, max_lon) of a grid cell."""
+    r, c = cell
+    return (r * size, c * size, (r + 1) * size, (c + 1) * size)
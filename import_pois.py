@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""Import police stations, hospitals and similar POIs from an OSM XML extract.
+
+Usage: python import_pois.py [extract.osm|extract.osm.bz2]
+
+Extracts can be cut from a Geofabrik download with e.g.
+    osmium tags-filter city.osm.pbf nwr/amenity=police,hospital,clinic,fire_station,pharmacy -o pois.osm
+"""
+import bz2
+import json
+import sys
+import xml.etree.ElementTree as ET
+
+from database import engine, Base
+from models import Poi
+from pois import POI_TYPES
+from sqlalchemy.orm import sessionmaker
+
+path = sys.argv[1] if len(sys.argv) > 1 else 'pois.osm'
+opener = bz2.open if path.endswith('.bz2') else open
+
+Base.metadata.create_all(bind=engine)
+
+# Nodes precede ways in OSM XML, so way centers can be computed in one pass
+node_coords = {}
+pois = []
+
+try:
+    with opener(path, 'rb') as f:
+        for _, elem in ET.iterparse(f, events=('end',)):
+            if elem.tag not in ('node', 'way'):
+                continue
+            tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+            osm_id = int(elem.get('id'))
+
+            if elem.tag == 'node':
+                lat, lon = float(elem.get('lat')), float(elem.get('lon'))
+                node_coords[osm_id] = (lat, lon)
+            else:
+                coords = [node_coords[int(nd.get('ref'))] for nd in elem.iter('nd') if int(nd.get('ref')) in node_coords]
+                if not coords:
+                    elem.clear()
+                    continue
+                lat = sum(c[0] for c in coords) / len(coords)
+                lon = sum(c[1] for c in coords) / len(coords)
+
+            amenity = tags.get('amenity')
+            if amenity in POI_TYPES:
+                pois.append(Poi(
+                    osm_id=osm_id,
+                    osm_type=elem.tag,
+                    amenity=amenity,
+                    name=(tags.get('name') or tags.get('operator') or tags.get('ref') or '')[:200],
+                    latitude=lat,
+                    longitude=lon,
+                    tags=json.dumps(tags)
+                ))
+            elem.clear()
+except Exception as e:
+    print(f"❌ Error reading OSM extract {path}: {e}")
+    exit(1)
+
+print(f"Found {len(pois)} POIs in {path}")
+
+Session = sessionmaker(bind=engine)
+session = Session()
+
+try:
+    session.query(Poi).delete()
+    session.add_all(pois)
+    session.commit()
+    print(f"\n✅ Successfully imported {len(pois)} POIs! Restart the API to serve them.")
+except Exception as e:
+    session.rollback()
+    print(f"❌ Error inserting POIs: {e}")
+finally:
+    session.close()
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import crime_index
+import risk_model
+from database import SessionLocal
+from dataset import bump_version, set_version
+from models import CrimeRecord
+from regions import region_cache
+from geofences import geofence_notifier
+
+# Records committed per transaction, and how long the writer waits for a
+# batch to fill before committing what it has
+BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '1000'))
+FLUSH_INTERVAL = float(os.getenv('INGEST_FLUSH_INTERVAL', '0.2'))
+# Records accepted but not yet committed; beyond this POST /crimes returns 503
+MAX_PENDING = int(os.getenv('INGEST_MAX_PENDING', '100000'))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class CrimeWriter:
+    """Background thread that commits submitted crimes in batches.
+
+    Each batch is one transaction that also bumps the dataset version; the
+    committed rows are then added to the shared CrimeIndex directly, so
+    readers never pay for a rebuild caused by ingestion, and handed to the
+    geofence notifier.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.committed = 0
+        self.failed = 0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def submit(self, crimes):
+        """Queue validated CrimeCreate objects. Returns the number now pending.
+
+        Raises QueueFull, without queueing any of them, if they don't all fit.
+        """
+        with self._cond:
+            if len(self._pending) + len(crimes) > self.max_pending:
+                raise QueueFull(f"{len(self._pending)} crimes already pending")
+            self._pending.extend(crimes)
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="crime-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return len(self._pending)
+
+    def pending(self):
+        return len(self._pending)
+
+    def stop(self, timeout=10):
+        """Commit whatever is pending and stop the thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending and not self._stopping:
+                self._cond.wait()
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._pending) < self.batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            self._write(batch)
+
+    def _write(self, batch):
+        records = [
+            CrimeRecord(
+                latitude=c.latitude,
+                longitude=c.longitude,
+                severity=c.severity,
+                crime_date=c.crime_date.isoformat(),
+                time=c.time.strftime("%H:%M"),
+                crime_type=c.crime_type
+            )
+            for c in batch
+        ]
+
+        db = SessionLocal()
+        try:
+            db.add_all(records)
+            version = bump_version(db)  # flushes, so ids are assigned
+            ids = [r.id for r in records]
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.failed += len(batch)
+            print(f"❌ Failed to commit {len(batch)} crimes: {e}")
+            return
+        finally:
+            db.close()
+
+        self.committed += len(batch)
+        rows = {
+            "ts": [crime_index.to_timestamp(datetime.combine(c.crime_date, c.time)) for c in batch],
+            "ids": ids,
+            "lat": [c.latitude for c in batch],
+            "lon": [c.longitude for c in batch],
+            "severity": [c.severity for c in batch],
+            "hour": [c.time.hour for c in batch],
+            "crime_type": [c.crime_type for c in batch],
+        }
+        region_cache.apply_rows(rows, version)
+        risk_model.apply_rows(rows, version)
+        set_version(version)
+        geofence_notifier.submit(rows)
+
+
+crime_writer = CrimeWriter()
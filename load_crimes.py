@@ -1,8 +1,9 @@
 #!/usr/bin/env python
 import pandas as pd
-from database import engine
-from models import CrimeRecord
+from database import engine, Base
+from models import CrimeArchive, CrimeCellSummary, CrimeRecord
 from sqlalchemy.orm import sessionmaker
+from dataset import bump_version
 
 # Try to load CSV
 try:
@@ -21,15 +22,19 @@ if missing:
     print(f"Available columns: {df.columns.tolist()}")
     exit(1)
 
+# Make sure dataset_meta exists even if the API has never been started
+Base.metadata.create_all(bind=engine)
+
 # Create session
 Session = sessionmaker(bind=engine)
 session = Session()
 
 try:
-    # Clear existing records
-    session.query(CrimeRecord).delete()
+    # Clear existing records, archived ones included, so nothing is counted twice
+    for table in (CrimeRecord, CrimeArchive, CrimeCellSummary):
+        session.query(table).delete()
     session.commit()
-    print("Cleared existing crime records")
+    print("Cleared existing crime records and archive")
     
     # Insert new records
     count = 0
@@ -52,8 +57,10 @@ try:
             print(f"Skipping row {idx}: {e}")
             continue
     
+    # Invalidate API caches (ETags) in the same transaction as the reload
+    version = bump_version(session)
     session.commit()
-    print(f"\n✅ Successfully inserted {count} crime records!")
+    print(f"\n✅ Successfully inserted {count} crime records! (dataset version {version})")
     
 except Exception as e:
     session.rollback()
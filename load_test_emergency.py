@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""Check that /emergency latency stays flat while /analyze is overloaded.
+
+Start the API first (uvicorn main:app), then run this script. It measures
+/emergency on an idle server, then again while many threads hammer
+/analyze, and compares the two.
+
+Run it from a different machine than the server (set base_url) when the
+server has few cores: the load generator's own CPU use otherwise shows up
+as /emergency latency.
+"""
+import multiprocessing
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+base_url = "http://localhost:8000"
+
+# Load is generated from separate processes so that client-side GIL
+# contention doesn't show up as /emergency latency
+ANALYZE_PROCESSES = 4
+ANALYZE_THREADS = 50  # per process
+EMERGENCY_SAMPLES = 50
+# Loaded p95 may be at most this many times the idle p95 (plus a small floor
+# for timer noise on very fast machines)
+MAX_SLOWDOWN = 3.0
+NOISE_FLOOR_MS = 20
+
+def hammer_analyze(stop, counts):
+    session = requests.Session()
+    while not stop.is_set():
+        lat = 41.65 + random.random() * 0.35
+        lon = -87.85 + random.random() * 0.30
+        try:
+            # Unique coordinates defeat the ETag cache, so every call does real work
+            resp = session.get(f"{base_url}/analyze?lat={lat}&lon={lon}", timeout=30)
+            code = resp.status_code
+        except Exception:
+            resp, code = None, "error"
+        if code == 503:
+            # Behave like a real client and back off as instructed
+            time.sleep(float(resp.headers.get("Retry-After", 1)))
+        with counts[1]:
+            counts[0][code] = counts[0].get(code, 0) + 1
+
+
+def analyze_worker(stop, results):
+    """One load process: ANALYZE_THREADS threads calling /analyze until stopped."""
+    counts = ({}, threading.Lock())
+    with ThreadPoolExecutor(max_workers=ANALYZE_THREADS) as pool:
+        for _ in range(ANALYZE_THREADS):
+            pool.submit(hammer_analyze, stop, counts)
+    results.put(counts[0])
+
+
+def emergency_latencies(n):
+    session = requests.Session()
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        resp = session.post(f"{base_url}/emergency", json={"lat": 41.88, "lon": -87.63, "note": "load test"}, timeout=30)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if resp.status_code != 200:
+            print(f"❌ /emergency returned HTTP {resp.status_code}")
+        time.sleep(0.05)
+    return latencies
+
+
+def p95(values):
+    return statistics.quantiles(values, n=20)[-1]
+
+
+if __name__ == "__main__":
+    print("Measuring /emergency on an idle server...")
+    idle = emergency_latencies(EMERGENCY_SAMPLES)
+    print(f"   p50 {statistics.median(idle):.1f} ms, p95 {p95(idle):.1f} ms")
+
+    print(f"\nOverloading /analyze with {ANALYZE_PROCESSES * ANALYZE_THREADS} concurrent clients...")
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=analyze_worker, args=(stop, results)) for _ in range(ANALYZE_PROCESSES)]
+    for w in workers:
+        w.start()
+    time.sleep(3)
+
+    loaded = emergency_latencies(EMERGENCY_SAMPLES)
+    stop.set()
+    analyze_status = {}
+    for _ in workers:
+        for code, count in results.get().items():
+            analyze_status[code] = analyze_status.get(code, 0) + count
+    for w in workers:
+        w.join()
+
+    print(f"   /emergency p50 {statistics.median(loaded):.1f} ms, p95 {p95(loaded):.1f} ms")
+    print(f"   /analyze responses by status: {analyze_status}")
+
+    limit = max(p95(idle) * MAX_SLOWDOWN, p95(idle) + NOISE_FLOOR_MS)
+    if p95(loaded) <= limit:
+        print(f"\n✅ /emergency latency stayed flat under load (p95 {p95(loaded):.1f} ms <= {limit:.1f} ms)")
+    else:
+        print(f"\n❌ /emergency slowed down under load (p95 {p95(loaded):.1f} ms > {limit:.1f} ms)")
@@ -1,23 +1,39 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from jose import jwt
+from jose import JWTError, jwt
 from datetime import datetime, timedelta
-import pandas as pd
-from pydantic import BaseModel
+from typing import List, Optional, Union
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
 import sms as sms_module
-from math import sin, cos, radians, sqrt
+from math import sin
 
 from database import engine, SessionLocal, Base
-from models import User
-from schemas import UserCreate, UserLogin
-from model import calculate_risk
+from models import User, Geofence, GeofenceAlert
+from schemas import UserCreate, UserLogin, CrimeCreate, GeofenceCreate
+from model import calculate_risk, end_of_hour, location_adjusted, crime_profile, risk_level, NEARBY_KM
+from crime_index import to_timestamp
+from dataset import current_version
+from caching import make_etag, cache_headers, etag_matches, not_modified
+from ingest import crime_writer, QueueFull
+from pois import POI_TYPES, nearby
+from tracker import RiskTracker
+from archive import with_archive, roll_over, ROLLOVER_INTERVAL_HOURS
+from regions import region_cache
+from geofences import geofence_notifier, next_revision
+from risk_model import get_batcher
+from admission import AdmissionControl
 
 # ================== APP SETUP ==================
 
 app = FastAPI(title="Unsafe Area AI Backend")
 
+# Added before CORS so that shed (503) responses still carry CORS headers
+app.add_middleware(AdmissionControl)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -48,6 +64,22 @@ def get_db():
     finally:
         db.close()
 
+bearer_scheme = HTTPBearer()
+
+def current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: Session = Depends(get_db)
+):
+    """The user whose /login token is sent as "Authorization: Bearer <token>"."""
+    try:
+        email = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        email = None
+    user = db.query(User).filter(User.email == email).first() if email else None
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+    return user
+
 # ================== ROOT ==================
 
 @app.get("/")
@@ -94,56 +126,93 @@ def login(user: UserLogin, db: Session = Depends(get_db)):
 
 # ================== RISK ANALYSIS (ENHANCED) ==================
 
-def haversine_dist(lat1, lon1, lat2, lon2):
-    """Calculate distance in km between two lat/lon points."""
-    R = 6371
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    c = 2 * sqrt(a) if a < 1 else 2
-    return R * c
+# Look-back windows (days) accepted by /analyze; None means all history
+ANALYZE_WINDOWS = (7, 30, 90, 365)
 
 @app.get("/analyze")
-def analyze(lat: float, lon: float):
+def analyze(
+    lat: float,
+    lon: float,
+    request: Request,
+    response: Response,
+    at: Optional[datetime] = None,
+    window: Optional[int] = None,
+    half_life: Optional[float] = None
+):
+    if window is not None and window not in ANALYZE_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {list(ANALYZE_WINDOWS)}")
+    if half_life is not None and half_life <= 0:
+        raise HTTPException(status_code=400, detail="half_life must be positive")
+
+    historical = at is not None or window is not None
+    if at is None:
+        # Score "now" at hour granularity so the response is cacheable for the hour
+        at = end_of_hour()
+    elif at.tzinfo is not None:
+        at = at.astimezone().replace(tzinfo=None)
+
+    # The learned model only scores "now" from its feature store; past,
+    # windowed and decayed queries always use the formula
+    batcher = get_batcher() if not historical and half_life is None else None
+    if batcher is not None and not batcher.model.is_current():
+        # Features behind the dataset or too old for their time windows
+        batcher = None
+    model_tag = batcher.model.built_at if batcher else None
+
+    etag = make_etag("analyze", current_version(), at.isoformat(), lat, lon, window, half_life, model_tag)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+
     try:
-        df = pd.read_sql(text("SELECT * FROM crime_records"), engine)
+        shard = region_cache.shard_at(lat, lon)
+        index, summary = shard.index, shard.cold
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    score, _, desc = calculate_risk(df, lat, lon)
-
-    # ========== LOCATION-BASED VARIATION ==========
-    # Even if no nearby crimes, use location coordinates to vary the score
-    # This ensures different locations show different risk levels
-    location_hash = abs(sin(lat * 12.9898 + lon * 78.233)) 
-    location_variance = int(location_hash * 50)  # 0-50 variance
-    
-    # Vary the base score based on location
-    score = score + location_variance
-    score = max(0, min(100, score))  # Clamp to 0-100
-
-    # Risk Classification
-    if score < 30:
-        level = "Low"
-    elif score < 70:
-        level = "Medium"
+    # Crimes older than the hot partition are archived: "now" scores add the
+    # archive's per-cell summary, historical queries reaching back past the
+    # hot partition read the archived rows around the point
+    crimes, cold = index, None
+    if summary.archived_until is not None:
+        if not historical:
+            cold = summary.around(lat, lon, NEARBY_KM)
+        else:
+            at_ts = to_timestamp(at)
+            start = None if window is None else at_ts - window * 86400
+            if start is None or start < summary.archived_until:
+                crimes = with_archive(index, lat, lon, NEARBY_KM, start, at_ts)
+
+    learned = None
+    if batcher is not None:
+        try:
+            learned = batcher.score(shard.name, lat, lon)
+        except Exception as e:
+            print(f"Risk model unavailable, using the formula: {e}")
+    if learned is not None:
+        score, scoring = learned, "model"
+        _, desc = risk_level(score)
     else:
-        level = "High"
+        score, _, desc = calculate_risk(crimes, lat, lon, at=at, window_days=window, half_life_days=half_life, cold=cold)
+        scoring = "formula"
+
+    score, level = location_adjusted(score, lat, lon)
 
     # ============ Generate 6-month TREND based on nearby crime density ============
     trend = []
-    if not df.empty and 'crime_date' in df.columns and 'latitude' in df.columns and 'longitude' in df.columns:
-        # Calculate distance for each crime record
-        df_copy = df.copy()
-        df_copy['distance_km'] = df_copy.apply(
-            lambda row: haversine_dist(lat, lon, row['latitude'], row['longitude']),
-            axis=1
-        )
-        nearby_crimes = df_copy[df_copy['distance_km'] <= 3.0]
+    nearby_crimes = []
+    if len(index) or summary.cells:
+        at_ts = to_timestamp(at)
+        start = None if window is None else at_ts - window * 86400
+        nearby_crimes = crimes.nearby(lat, lon, NEARBY_KM, crimes.window(start, at_ts))
+        nearby_count = len(nearby_crimes)
+        if cold is not None:
+            # Archived crimes around the point, from the cell summary
+            nearby_count += int(cold[1].sum())
         
-        if not nearby_crimes.empty:
+        if nearby_count:
             # Compute base monthly average
-            base_count = max(1, len(nearby_crimes) / 6)
+            base_count = max(1, nearby_count / 6)
             
             # Create 6-month trend with location-based determinism
             for month_idx in range(6):
@@ -166,7 +235,7 @@ def analyze(lat: float, lon: float):
                 month_val = max(5, min(100, int(month_val)))
                 trend.append(month_val)
     else:
-        # Fallback: DB missing columns or empty - use location-based generation
+        # Fallback: no crime data loaded - use location-based generation
         base = max(1, int(score / 15))
         for month_idx in range(6):
             seed = lat * 12.9898 + lon * 78.233 + month_idx * 2.5
@@ -174,44 +243,314 @@ def analyze(lat: float, lon: float):
             month_val = max(5, min(100, int(base * (0.7 + 0.3 * (1 + noise) / 2))))
             trend.append(month_val)
 
-    # ============ Peak Hours based on risk level ============
-    if level == "High":
-        peak_hours = ["18:00-20:00", "22:00-02:00"]
-    elif level == "Medium":
-        peak_hours = ["19:00-21:00", "23:00-01:00"]
+    # ============ Crime types and peak hours from the cell histograms ============
+    if historical:
+        # The precomputed histograms cover all history; a past or windowed
+        # query needs exactly the crimes selected above
+        hist = crimes.histogram(nearby_crimes) if len(nearby_crimes) else None
     else:
-        peak_hours = ["20:00-22:00"]
+        hist = crimes.profile(lat, lon, NEARBY_KM, summary)
+    profile = crime_profile(hist, crimes.types.names) if hist is not None else None
+
+    if profile is None:
+        # No crimes on record nearby: fall back to level-based defaults
+        if level == "High":
+            peak_hours = ["18:00-20:00", "22:00-02:00"]
+        elif level == "Medium":
+            peak_hours = ["19:00-21:00", "23:00-01:00"]
+        else:
+            peak_hours = ["20:00-22:00"]
+        profile = {"type": "Normal", "type_breakdown": [], "severity_breakdown": {}, "peak_hours": peak_hours}
 
     return {
         "risk_score": round(score, 2),
         "risk_level": level,
         "description": desc,
         "trend": trend,
-        "peak_hours": peak_hours,
-        "type": "Assault" if level == "High" else "Theft" if level == "Medium" else "Normal"
+        "peak_hours": profile["peak_hours"],
+        "type": profile["type"],
+        "type_breakdown": profile["type_breakdown"],
+        "severity_breakdown": profile["severity_breakdown"],
+        "scoring": scoring
     }
 
+# ================== LIVE TRACKING ==================
+
+@app.websocket("/ws/track")
+async def track(websocket: WebSocket):
+    """Stream risk updates for a moving client.
+
+    The client sends {"lat": ..., "lon": ...} on every position change; the
+    server replies only when the risk score, level or scorer ("scoring":
+    "model" or "formula", as in /analyze) actually changes.
+    """
+    await websocket.accept()
+    tracker = RiskTracker()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                position = json.loads(message)
+                lat, lon = float(position["lat"]), float(position["lon"])
+            except (ValueError, KeyError, TypeError):
+                await websocket.send_json({"error": "send {\"lat\": ..., \"lon\": ...}"})
+                continue
+            # May load a region and scan cells, so keep it off the event loop
+            update = await asyncio.to_thread(tracker.update, lat, lon)
+            if update is not None:
+                await websocket.send_json(update)
+    except WebSocketDisconnect:
+        pass
+
 # ================== HEATMAP ==================
 
+def region_shards(region):
+    """Shards for ?region=: the named one, or every region (crimes outside them included) if omitted."""
+    names = region_cache.names if region is None else [region]
+    if region is not None and region not in region_cache.names:
+        raise HTTPException(status_code=404, detail=f"Unknown region {region!r}")
+    try:
+        return [region_cache.shard(name) for name in names]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/heatmap")
-def heatmap():
+def heatmap(request: Request, response: Response, region: Optional[str] = None):
+    shards = region_shards(region)
+    etag = make_etag("heatmap", region, [(s.name, s.content_version) for s in shards])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    try:
+        if len(shards) == 1:
+            points = shards[0].heatmap()
+        else:
+            points = [point for shard in shards for point in shard.heatmap()]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    response.headers.update(cache_headers(etag))
+    return points
+
+# ================== HOTSPOTS ==================
+
+@app.get("/hotspots")
+def hotspots(request: Request, response: Response, region: Optional[str] = None):
+    """KMeans hotspots of a region, or of every region side by side if omitted."""
+    shards = region_shards(region)
+    etag = make_etag("hotspots", region, [(s.name, s.content_version) for s in shards])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     try:
-        df = pd.read_sql(
-            text("SELECT latitude, longitude FROM crime_records"),
-            engine
-        )
+        clusters = [cluster for shard in shards for cluster in shard.hotspots()]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    return df.to_dict(orient="records")
+    response.headers.update(cache_headers(etag))
+    return clusters
+
+# ================== REGIONS ==================
+
+@app.get("/regions")
+def regions():
+    """Configured regions with their load state and memory use."""
+    return region_cache.status()
+
+# ================== NEARBY POIS ==================
+
+MAX_NEARBY_RADIUS = 10000  # metres
+MAX_NEARBY_LIMIT = 100
+
+@app.get("/nearby")
+def nearby_pois(lat: float, lon: float, radius: int = 1000, types: Optional[str] = None, limit: int = 20):
+    """Police stations, hospitals etc. within radius metres, from the imported OSM extract.
+
+    types is a comma-separated list of amenity values (default: all of POI_TYPES).
+    """
+    if not 0 < radius <= MAX_NEARBY_RADIUS:
+        raise HTTPException(status_code=400, detail=f"radius must be between 1 and {MAX_NEARBY_RADIUS}")
+    if types:
+        wanted = tuple(sorted({t.strip() for t in types.split(",") if t.strip()}))
+        unknown = [t for t in wanted if t not in POI_TYPES]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown POI types: {unknown}")
+    else:
+        wanted = POI_TYPES
+    limit = max(1, min(MAX_NEARBY_LIMIT, limit))
+
+    try:
+        # ~10 m rounding lets repeated clicks around the same spot hit the cache
+        results = nearby(round(lat, 4), round(lon, 4), radius, wanted, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"results": results}
+
+# ================== CRIME INGESTION ==================
+
+# Largest list accepted by a single POST /crimes
+MAX_BULK_CRIMES = 10000
+
+@app.post("/crimes", status_code=status.HTTP_202_ACCEPTED)
+def add_crimes(payload: Union[CrimeCreate, List[CrimeCreate]]):
+    """Queue one crime or a list of crimes for the background writer.
+
+    Records are committed in batches within INGEST_FLUSH_INTERVAL seconds and
+    then show up in /analyze and /heatmap without a reload.
+    """
+    crimes = payload if isinstance(payload, list) else [payload]
+    if len(crimes) > MAX_BULK_CRIMES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_CRIMES} crimes per request")
+
+    try:
+        pending = crime_writer.submit(crimes)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+    return {"queued": len(crimes), "pending": pending}
+
+@app.on_event("shutdown")
+def flush_crime_writer():
+    crime_writer.stop()
+    geofence_notifier.stop()
+
+# ================== GEOFENCES ==================
+
+MAX_ALERTS = 500
+
+def geofence_dict(fence: Geofence):
+    return {
+        "id": fence.id,
+        "user_id": fence.user_id,
+        "name": fence.name,
+        "latitude": fence.latitude,
+        "longitude": fence.longitude,
+        "radius_m": fence.radius_m,
+        "polygon": json.loads(fence.polygon) if fence.polygon else None,
+        "phone": fence.phone,
+        "min_severity": fence.min_severity,
+        "created_at": fence.created_at,
+    }
+
+def owned_geofence(fence_id: int, user: User, db: Session):
+    # Other users' fences are reported as missing rather than forbidden
+    fence = db.query(Geofence).filter(
+        Geofence.id == fence_id, Geofence.user_id == user.id, Geofence.active == True
+    ).first()
+    if fence is None:
+        raise HTTPException(status_code=404, detail="Geofence not found")
+    return fence
+
+@app.post("/geofences", status_code=status.HTTP_201_CREATED)
+def create_geofence(fence: GeofenceCreate, user: User = Depends(current_user), db: Session = Depends(get_db)):
+    """Register a circle or polygon to be alerted about new crimes inside it.
+
+    Fences belong to the logged-in user, and only they can list, delete or
+    read alerts of them. Alerts are stored for GET /geofences/{id}/alerts
+    and, if phone is set, sent by SMS in batches.
+    """
+    new_fence = Geofence(
+        user_id=user.id,
+        name=fence.name,
+        latitude=fence.latitude,
+        longitude=fence.longitude,
+        radius_m=fence.radius_m,
+        polygon=json.dumps([list(p) for p in fence.polygon]) if fence.polygon else None,
+        phone=fence.phone,
+        min_severity=fence.min_severity,
+        active=True,
+        revision=next_revision()
+    )
+    db.add(new_fence)
+    db.commit()
+    db.refresh(new_fence)
+    return geofence_dict(new_fence)
+
+@app.get("/geofences")
+def list_geofences(user: User = Depends(current_user), db: Session = Depends(get_db)):
+    query = db.query(Geofence).filter(Geofence.active == True, Geofence.user_id == user.id)
+    return [geofence_dict(f) for f in query.order_by(Geofence.id).all()]
+
+@app.delete("/geofences/{fence_id}")
+def delete_geofence(fence_id: int, user: User = Depends(current_user), db: Session = Depends(get_db)):
+    # Deactivated rather than deleted, so matchers see the change when they sync
+    updated = db.query(Geofence).filter(
+        Geofence.id == fence_id, Geofence.user_id == user.id, Geofence.active == True
+    ).update(
+        {Geofence.active: False, Geofence.revision: next_revision()},
+        synchronize_session=False
+    )
+    db.commit()
+    if not updated:
+        raise HTTPException(status_code=404, detail="Geofence not found")
+    return {"message": "Geofence deleted"}
+
+@app.get("/geofences/{fence_id}/alerts")
+def geofence_alerts(
+    fence_id: int,
+    after: int = 0,
+    limit: int = 100,
+    user: User = Depends(current_user),
+    db: Session = Depends(get_db)
+):
+    """Alerts of a fence with id greater than ``after``, oldest first, for polling clients."""
+    if not 0 < limit <= MAX_ALERTS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_ALERTS}")
+    owned_geofence(fence_id, user, db)
+    alerts = (
+        db.query(GeofenceAlert)
+        .filter(GeofenceAlert.geofence_id == fence_id, GeofenceAlert.id > after)
+        .order_by(GeofenceAlert.id)
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "id": a.id,
+            "crime_id": a.crime_id,
+            "crime_type": a.crime_type,
+            "severity": a.severity,
+            "latitude": a.latitude,
+            "longitude": a.longitude,
+            "occurred_at": a.occurred_at,
+        }
+        for a in alerts
+    ]
+
+# ================== ARCHIVE ROLL-OVER ==================
+
+async def roll_over_periodically():
+    # Wait an interval first, so restarting the API never moves data by itself
+    while True:
+        await asyncio.sleep(ROLLOVER_INTERVAL_HOURS * 3600)
+        try:
+            moved = await asyncio.get_running_loop().run_in_executor(None, roll_over)
+            if moved:
+                print(f"Archived {moved} crimes older than the hot partition")
+        except Exception as e:
+            print(f"Archive roll-over failed: {e}")
+
+@app.on_event("startup")
+async def schedule_roll_over():
+    if ROLLOVER_INTERVAL_HOURS > 0:
+        app.state.roll_over_task = asyncio.create_task(roll_over_periodically())
 
 # ================== EMERGENCY ==================
 
+# Threads reserved for /emergency so it never waits behind analytics work in
+# the shared threadpool; AdmissionControl also lets it bypass every queue
+EMERGENCY_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="emergency")
+
 @app.post("/emergency")
-def emergency(data: dict):
+async def emergency(data: dict):
     """Trigger emergency: data should include lat, lon and optional message or phone.
     This will attempt to send SMS to configured helpline numbers via sms.send_sms.
     """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(EMERGENCY_EXECUTOR, send_emergency, data)
+
+def send_emergency(data: dict):
     print("🚨 Emergency Triggered:", data)
 
     lat = data.get('lat')
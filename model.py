@@ -36,11 +36,14 @@
 #         description = "High crime density. Avoid during late hours."
 
 #     return risk_score, level, description
-import pandas as pd
+import os
+import time
 import numpy as np
 from sklearn.cluster import KMeans
 from math import radians, sin, cos, sqrt, asin
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from crime_index import CrimeIndex, to_timestamp
 
 def haversine(lat1, lon1, lat2, lon2):
     R = 6371
@@ -50,52 +53,203 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * asin(sqrt(a))
     return R * c
 
-def calculate_risk(df, user_lat, user_lon):
-
-    df["distance"] = df.apply(
-        lambda row: haversine(user_lat, user_lon, row["latitude"], row["longitude"]),
-        axis=1
-    )
+# Radius (km) counted as "nearby" and the look-back that counts as "recent"
+NEARBY_KM = 3
+RECENT_DAYS = 30
+
+def end_of_hour(now=None):
+    """Last second of the current hour.
+
+    "Now" scores use this as their cut-off, so they stay the same for the
+    whole hour while still counting crimes reported during it.
+    """
+    hour = (now or datetime.now()).replace(minute=0, second=0, microsecond=0)
+    return hour + timedelta(hours=1, seconds=-1)
+
+def calculate_risk(data, user_lat, user_lon, at=None, window_days=None, half_life_days=None, cold=None):
+    """Score crime risk around a point as of ``at`` (default: now).
+
+    ``data`` is a CrimeIndex, or a DataFrame of crime_records rows which is
+    indexed on the fly. Only crimes up to ``at`` are counted; ``window_days``
+    limits them to the preceding N days and ``half_life_days`` weights each
+    crime by exp-decay of its age instead of counting it once.
+
+    ``cold`` optionally adds pre-aggregated archive buckets, as arrays of
+    (timestamp, crime count, severity sum) from ColdSummary.around.
+    """
+    index = data if isinstance(data, CrimeIndex) else CrimeIndex(data)
+    at = at or datetime.now()
+    at_ts = to_timestamp(at)
+
+    start = None if window_days is None else at_ts - window_days * 86400
+    nearby = index.nearby(user_lat, user_lon, NEARBY_KM, index.window(start, at_ts))
+
+    ts = index.ts[nearby]
+    count = np.ones(len(nearby))
+    severity = index.severity[nearby]
+    if cold is not None:
+        cold_ts, cold_count, cold_severity = cold
+        keep = (cold_ts <= at_ts) if start is None else (cold_ts > start) & (cold_ts <= at_ts)
+        ts = np.concatenate([cold_ts[keep], ts])
+        count = np.concatenate([cold_count[keep], count])
+        severity = np.concatenate([cold_severity[keep], severity])
+
+    if count.sum() == 0:
+        return 5, "Low Risk", "No major crimes nearby."
 
-    nearby = df[df["distance"] <= 3]
+    if half_life_days:
+        weights = 0.5 ** ((at_ts - ts) / (half_life_days * 86400))
+        frequency = float((count * weights).sum())
+        avg_severity = float((severity * weights).sum() / frequency) if frequency > 0 else 0
+    else:
+        frequency = int(count.sum())
+        avg_severity = severity.sum() / frequency
 
-    if nearby.empty:
-        return 5, "Low Risk", "No major crimes nearby."
+    recent_count = int(count[ts > at_ts - RECENT_DAYS * 86400].sum())
 
-    frequency = len(nearby)
-    avg_severity = nearby["severity"].mean()
+    return score_risk(frequency, avg_severity, recent_count, at.hour)
 
-    recent = nearby[
-        pd.to_datetime(nearby["crime_date"]) >
-        datetime.now() - pd.Timedelta(days=30)
-    ]
 
-    night_weight = 1.5 if datetime.now().hour >= 20 else 1
+def score_risk(frequency, avg_severity, recent_count, hour):
+    """Apply the risk formula to neighbourhood statistics."""
+    night_weight = 1.5 if hour >= 20 else 1
 
     risk_score = (
         (frequency * 0.4) +
         (avg_severity * 0.3) +
-        (len(recent) * 0.2) +
+        (recent_count * 0.2) +
         (night_weight * 0.1)
     )
 
     risk_score = min(100, int(risk_score * 5))
 
+    level, desc = risk_level(risk_score)
+    return risk_score, level, desc
+
+
+def risk_level(risk_score):
+    """Level and description for a 0-100 risk score."""
     if risk_score < 30:
-        level = "Low Risk"
-        desc = "Area shows low crime frequency."
+        return "Low Risk", "Area shows low crime frequency."
     elif risk_score < 70:
-        level = "Medium Risk"
-        desc = "Moderate crime density detected."
+        return "Medium Risk", "Moderate crime density detected."
     else:
-        level = "High Risk"
-        desc = "High crime zone. Avoid late hours."
+        return "High Risk", "High crime zone. Avoid late hours."
 
-    return risk_score, level, desc
+
+def location_adjusted(score, lat, lon):
+    """Add the deterministic per-location variation /analyze reports, and classify.
+
+    Returns (score clamped to 0-100, "Low" / "Medium" / "High").
+    """
+    # Even if no nearby crimes, use location coordinates to vary the score
+    # This ensures different locations show different risk levels
+    location_hash = abs(sin(lat * 12.9898 + lon * 78.233))
+    score = max(0, min(100, score + int(location_hash * 50)))  # 0-50 variance
+
+    if score < 30:
+        level = "Low"
+    elif score < 70:
+        level = "Medium"
+    else:
+        level = "High"
+    return score, level
+
+
+# Length of the peak-hour windows reported by crime_profile
+PEAK_WINDOW_HOURS = 2
+
+def crime_profile(hist, type_names, top=5):
+    """Summarize a type x severity x hour histogram (see CrimeIndex.profile).
+
+    Returns None when the histogram is empty, otherwise the most common
+    crime type, the top types with their shares, counts per severity and
+    the two busiest non-overlapping PEAK_WINDOW_HOURS windows.
+    """
+    by_type = hist.sum(axis=(1, 2))
+    total = int(by_type.sum())
+    if total == 0:
+        return None
+
+    top_types = [i for i in np.argsort(-by_type, kind="stable")[:top] if by_type[i] > 0]
+    by_hour = hist.sum(axis=(0, 1))
+    # Windows wrap around midnight
+    windows = sum(np.roll(by_hour, -k) for k in range(PEAK_WINDOW_HOURS))
+    peaks = []
+    for start in np.argsort(-windows, kind="stable").tolist():
+        if windows[start] == 0 or len(peaks) == 2:
+            break
+        if all(min((start - p) % 24, (p - start) % 24) >= PEAK_WINDOW_HOURS for p in peaks):
+            peaks.append(start)
+
+    return {
+        "type": type_names[top_types[0]],
+        "type_breakdown": [
+            {"type": type_names[i], "count": int(by_type[i]), "share": round(by_type[i] / total, 3)}
+            for i in top_types
+        ],
+        "severity_breakdown": {str(level + 1): int(count) for level, count in enumerate(hist.sum(axis=(0, 2)))},
+        "peak_hours": [f"{h:02d}:00-{(h + PEAK_WINDOW_HOURS) % 24:02d}:00" for h in peaks],
+    }
 
 
 def detect_hotspots(df):
     coords = df[["latitude", "longitude"]]
     kmeans = KMeans(n_clusters=5)
     df["cluster"] = kmeans.fit_predict(coords)
-    return df
\ No newline at end of file
+    return df
+
+
+HOTSPOT_CLUSTERS = 5
+# Hotspots are refit from scratch at most this often; crimes added in between
+# join their nearest cluster
+HOTSPOT_REFIT_SECONDS = float(os.getenv('HOTSPOT_REFIT_SECONDS', '300'))
+
+class Hotspots:
+    """KMeans clusters of weighted points, as detect_hotspots finds them, that can take new points.
+
+    ``with_points`` adds points to their nearest cluster's count and mean
+    without refitting; ``stale`` says when a refit is due.
+    """
+
+    def __init__(self, lats, lons, weights=None):
+        self.fitted_at = time.monotonic()
+        coords = np.column_stack([lats, lons]).astype(np.float64)
+        weights = np.ones(len(coords)) if weights is None else np.asarray(weights, dtype=np.float64)
+        if len(coords) < HOTSPOT_CLUSTERS:
+            self.centres = None
+            return
+        kmeans = KMeans(n_clusters=HOTSPOT_CLUSTERS).fit(coords, sample_weight=weights)
+        self.centres = kmeans.cluster_centers_
+        self._accumulate(kmeans.labels_, coords, weights, np.zeros(HOTSPOT_CLUSTERS), np.zeros((HOTSPOT_CLUSTERS, 2)))
+
+    def _accumulate(self, labels, coords, weights, counts, sums):
+        self.counts = counts + np.bincount(labels, weights=weights, minlength=HOTSPOT_CLUSTERS)
+        self.sums = sums + np.column_stack([
+            np.bincount(labels, weights=weights * coords[:, k], minlength=HOTSPOT_CLUSTERS) for k in range(2)
+        ])
+
+    def stale(self, max_age=HOTSPOT_REFIT_SECONDS):
+        return time.monotonic() - self.fitted_at > max_age
+
+    def with_points(self, lats, lons, weights=None):
+        """New Hotspots with the points added to their nearest clusters, or None if there are no clusters yet."""
+        if self.centres is None:
+            return None
+        coords = np.column_stack([lats, lons]).astype(np.float64)
+        weights = np.ones(len(coords)) if weights is None else np.asarray(weights, dtype=np.float64)
+        labels = ((coords[:, None, :] - self.centres[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        updated = Hotspots.__new__(Hotspots)
+        updated.fitted_at = self.fitted_at
+        updated.centres = self.centres
+        updated._accumulate(labels, coords, weights, self.counts, self.sums)
+        return updated
+
+    def clusters(self):
+        """[{"latitude", "longitude", "count"}] of the non-empty clusters."""
+        if self.centres is None:
+            return []
+        return [
+            {"latitude": float(s[0] / n), "longitude": float(s[1] / n), "count": int(round(n))}
+            for s, n in zip(self.sums, self.counts) if n > 0
+        ]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean
 from datetime import datetime
 from database import Base
 
@@ -12,6 +12,8 @@ class User(Base):
 
 class CrimeRecord(Base):
     __tablename__ = "crime_records"
+    # Ids freed by archive.roll_over must not be handed out again
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
     latitude = Column(Float)
@@ -19,4 +21,83 @@ class CrimeRecord(Base):
     severity = Column(Integer, default=1)
     crime_date = Column(String(10))  # YYYY-MM-DD
     time = Column(String(5))  # HH:MM
-    crime_type = Column(String(100), default="Unknown")
\ No newline at end of file
+    crime_type = Column(String(100), default="Unknown")
+
+class DatasetMeta(Base):
+    __tablename__ = "dataset_meta"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class Poi(Base):
+    __tablename__ = "pois"
+
+    id = Column(Integer, primary_key=True, index=True)
+    osm_id = Column(Integer)
+    osm_type = Column(String(10))  # node / way
+    amenity = Column(String(50), index=True)
+    name = Column(String(200))
+    latitude = Column(Float)
+    longitude = Column(Float)
+    tags = Column(String)  # JSON object of the OSM tags
+
+class CrimeArchive(Base):
+    """Crimes rolled out of crime_records by archive.roll_over, with ISO dates."""
+    __tablename__ = "crime_archive"
+
+    id = Column(Integer, primary_key=True)
+    # id in crime_records. Tables created before AUTOINCREMENT can reuse ids, so not unique.
+    source_id = Column(Integer, index=True)
+    latitude = Column(Float, index=True)
+    longitude = Column(Float)
+    severity = Column(Integer, default=1)
+    crime_date = Column(String(10), index=True)  # YYYY-MM-DD
+    time = Column(String(5))  # HH:MM
+    crime_type = Column(String(100), default="Unknown")
+
+class CrimeCellSummary(Base):
+    """Archived crimes counted per grid cell, month, type, severity and hour of day."""
+    __tablename__ = "crime_cell_summary"
+
+    id = Column(Integer, primary_key=True)
+    cell_row = Column(Integer)  # floor(latitude / CELL_DEG)
+    cell_col = Column(Integer)  # floor(longitude / CELL_DEG)
+    month = Column(String(7))  # YYYY-MM
+    crime_type = Column(String(100))
+    severity = Column(Integer)
+    hour = Column(Integer)  # 0-23
+    count = Column(Integer, default=0)
+    severity_sum = Column(Integer, default=0)
+
+class Geofence(Base):
+    """A circle or polygon a user wants alerts for when crimes are recorded inside it."""
+    __tablename__ = "geofences"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, index=True, nullable=True)
+    name = Column(String(100))
+    latitude = Column(Float)  # circle centre
+    longitude = Column(Float)
+    radius_m = Column(Float)
+    polygon = Column(String)  # JSON list of [lat, lon], instead of a circle
+    phone = Column(String(20), nullable=True)  # SMS alerts; otherwise alerts are only stored
+    min_severity = Column(Integer, default=1)
+    active = Column(Boolean, default=True)
+    # Increases on every insert and deactivation, so matchers can sync changes
+    revision = Column(Integer, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class GeofenceAlert(Base):
+    """A crime recorded inside a geofence, waiting for the fence's owner to read it."""
+    __tablename__ = "geofence_alerts"
+
+    id = Column(Integer, primary_key=True)
+    geofence_id = Column(Integer, index=True)
+    crime_id = Column(Integer)
+    crime_type = Column(String(100))
+    severity = Column(Integer)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    occurred_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -11,6 +11,7 @@ function MapPage() {
   const chartRef = useRef(null);
   const chartInstanceRef = useRef(null);
   const mapInstanceRef = useRef(null);
+  const hereMarkerRef = useRef(null);
   const [location, setLocation] = useState(null);
   const [selected, setSelected] = useState(null);
   const [loadingAnalysis, setLoadingAnalysis] = useState(false);
@@ -36,37 +37,15 @@ function MapPage() {
   };
 
   const fetchNearby = async (lat, lon, radius = 1000) => {
-    const q = `
-      [out:json][timeout:15];
-      (
-        node["amenity"="hospital"](around:${radius},${lat},${lon});
-        way["amenity"="hospital"](around:${radius},${lat},${lon});
-        node["amenity"="police"](around:${radius},${lat},${lon});
-        way["amenity"="police"](around:${radius},${lat},${lon});
-      );
-      out center 20;
-    `;
     try {
-      const res = await fetch('https://overpass-api.de/api/interpreter', {
-        method: 'POST',
-        body: q,
-        headers: { 'Content-Type': 'text/plain' }
-      });
+      const res = await fetch(`${API_BASE}/nearby?lat=${lat}&lon=${lon}&radius=${radius}&types=hospital,police&limit=20`);
       if (!res.ok) return;
       const j = await res.json();
-      const elems = j.elements || [];
       const hospitals = [];
       const police = [];
-      for (const el of elems) {
-        const tags = el.tags || {};
-        const name = tags.name || (tags.operator || '') || (tags.ref || '');
-        const type = tags.amenity || '';
-        const latc = el.lat ?? (el.center && el.center.lat);
-        const lonc = el.lon ?? (el.center && el.center.lon);
-        const elemType = el.type || 'node';
-        const item = { id: el.id, osmid: el.id, osmType: elemType, name: name || `${type} ${el.id}`, type, lat: latc, lon: lonc, tags };
-        if (type === 'hospital') hospitals.push(item);
-        if (type === 'police') police.push(item);
+      for (const item of (j.results || [])) {
+        if (item.type === 'hospital') hospitals.push(item);
+        if (item.type === 'police') police.push(item);
       }
       setNearbyHospitals(hospitals.slice(0, 5));
       setNearbyPolice(police.slice(0, 5));
@@ -151,7 +130,7 @@ function MapPage() {
         attribution: "© OpenStreetMap",
       }).addTo(map);
 
-      L.circleMarker([location.lat, location.lng], { radius: 10, color: "#06b6d4", fillOpacity: 0.9 })
+      hereMarkerRef.current = L.circleMarker([location.lat, location.lng], { radius: 10, color: "#06b6d4", fillOpacity: 0.9 })
         .addTo(map).bindPopup("You are here");
 
       const unsafeLocations = [
@@ -239,20 +218,20 @@ function MapPage() {
           const level = json.risk_level || json.level || (score > 70 ? 'High' : score > 30 ? 'Medium' : 'Low');
           const peakHours = json.peak_hours || json.peakHours || deterministicTrend(score).map((v, i) => `${17 + i}:00-${18 + i}:00`);
           const trend = json.trend || deterministicTrend(score);
-          setSelected({ lat: location.lat, lng: location.lng, score, risk_level: level, description: json.description || '', peakHours, type: json.type || '', source: 'backend', trend });
+          setSelected({ lat: location.lat, lng: location.lng, score, risk_level: level, description: json.description || '', peakHours, type: json.type || '', source: 'backend', trend, here: true });
           fetchNearby(location.lat, location.lng);
         } else {
           const score = deterministicScore(location.lat, location.lng);
           const peakHours = deterministicTrend(score).map((v, i) => `${17 + i}:00-${18 + i}:00`);
           const trend = deterministicTrend(score);
-          setSelected({ lat: location.lat, lng: location.lng, score, risk_level: score > 70 ? 'High' : score > 30 ? 'Medium' : 'Low', description: '', peakHours, type: '', source: 'local', trend });
+          setSelected({ lat: location.lat, lng: location.lng, score, risk_level: score > 70 ? 'High' : score > 30 ? 'Medium' : 'Low', description: '', peakHours, type: '', source: 'local', trend, here: true });
           fetchNearby(location.lat, location.lng);
         }
       } catch (e) {
         const score = deterministicScore(location.lat, location.lng);
         const peakHours = deterministicTrend(score).map((v, i) => `${17 + i}:00-${18 + i}:00`);
         const trend = deterministicTrend(score);
-        setSelected({ lat: location.lat, lng: location.lng, score, risk_level: score > 70 ? 'High' : score > 30 ? 'Medium' : 'Low', description: '', peakHours, type: '', source: 'local', trend });
+        setSelected({ lat: location.lat, lng: location.lng, score, risk_level: score > 70 ? 'High' : score > 30 ? 'Medium' : 'Low', description: '', peakHours, type: '', source: 'local', trend, here: true });
         fetchNearby(location.lat, location.lng);
       } finally {
         setLoadingAnalysis(false);
@@ -265,6 +244,62 @@ function MapPage() {
     };
   }, [location]);
 
+  // Live tracking: position updates go over one WebSocket to /ws/track, which
+  // answers only when the risk score or level changes, instead of an /analyze
+  // request per move. Map clicks keep using /analyze.
+  const hasLocation = Boolean(location);
+  useEffect(() => {
+    if (!hasLocation || !navigator.geolocation || typeof WebSocket === 'undefined') return;
+    let socket = null;
+    let last = null;
+    let closed = false;
+    let reconnectTimer = null;
+
+    const send = () => {
+      if (last && socket && socket.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify({ lat: last.lat, lon: last.lng }));
+      }
+    };
+
+    const connect = () => {
+      socket = new WebSocket(`${API_BASE.replace(/^http/, 'ws')}/ws/track`);
+      socket.onopen = send;
+      socket.onmessage = (event) => {
+        let json;
+        try { json = JSON.parse(event.data); } catch (e) { return; }
+        if (json.error || !last) return;
+        const here = last;
+        // Only the card showing the user's own position follows them
+        setSelected((prev) => (prev && prev.here ? {
+          ...prev,
+          lat: here.lat,
+          lng: here.lng,
+          score: json.risk_score,
+          risk_level: json.risk_level,
+          description: json.description || prev.description,
+          source: 'live',
+        } : prev));
+      };
+      socket.onclose = () => {
+        if (!closed) reconnectTimer = setTimeout(connect, 5000);
+      };
+    };
+
+    const watchId = navigator.geolocation.watchPosition((pos) => {
+      last = { lat: pos.coords.latitude, lng: pos.coords.longitude };
+      try { if (hereMarkerRef.current) hereMarkerRef.current.setLatLng([last.lat, last.lng]); } catch (e) { }
+      send();
+    }, () => { }, { enableHighAccuracy: true, maximumAge: 10000 });
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(reconnectTimer);
+      navigator.geolocation.clearWatch(watchId);
+      try { if (socket) socket.close(); } catch (e) { }
+    };
+  }, [hasLocation]);
+
   useEffect(() => {
     if (!selected || !chartRef.current) return;
     const data = (selected.trend || deterministicTrend(selected.score || 20)).map(v => Math.max(5, v));
@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from database import engine
+from grid import cell_of, cells_covering
+from crime_index import haversine_km
+
+# amenity=* values imported by import_pois.py and served by /nearby
+POI_TYPES = ("police", "hospital", "clinic", "fire_station", "pharmacy")
+
+# Grid cell size in degrees (~1.1 km of latitude)
+CELL_DEG = 0.01
+NEARBY_CACHE_SIZE = int(os.getenv('NEARBY_CACHE_SIZE', '4096'))
+
+
+class PoiIndex:
+    """POIs bucketed into a lat/lon grid for radius queries."""
+
+    def __init__(self, df):
+        self.lat = df["latitude"].to_numpy(dtype=np.float64)
+        self.lon = df["longitude"].to_numpy(dtype=np.float64)
+        self.amenity = df["amenity"].to_numpy(dtype=object)
+        self.records = [
+            {
+                "id": int(r.osm_id),
+                "osmid": int(r.osm_id),
+                "osmType": r.osm_type,
+                "name": r.name or f"{r.amenity} {r.osm_id}",
+                "type": r.amenity,
+                "lat": float(r.latitude),
+                "lon": float(r.longitude),
+                "tags": json.loads(r.tags) if r.tags else {},
+            }
+            for r in df.itertuples()
+        ]
+        cells = {}
+        for i, (la, lo) in enumerate(zip(self.lat.tolist(), self.lon.tolist())):
+            cells.setdefault(cell_of(la, lo, CELL_DEG), []).append(i)
+        self.cells = {k: np.array(v, dtype=np.int64) for k, v in cells.items()}
+
+    def __len__(self):
+        return len(self.records)
+
+    def query(self, lat, lon, radius_m, types, limit):
+        """POIs of the given types within radius_m of (lat, lon), nearest first."""
+        buckets = [self.cells[c] for c in cells_covering(lat, lon, radius_m / 1000, CELL_DEG) if c in self.cells]
+        if not buckets:
+            return []
+        candidates = np.concatenate(buckets)
+        if types:
+            candidates = candidates[np.isin(self.amenity[candidates], list(types))]
+        dist = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates]) * 1000
+        inside = dist <= radius_m
+        candidates, dist = candidates[inside], dist[inside]
+        order = np.argsort(dist, kind="stable")[:limit]
+        return [dict(self.records[i], distance_m=int(round(d))) for i, d in zip(candidates[order].tolist(), dist[order].tolist())]
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def get_poi_index():
+    """Load the pois table into a PoiIndex on first use."""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                df = pd.read_sql(
+                    text("SELECT osm_id, osm_type, amenity, name, latitude, longitude, tags FROM pois"),
+                    engine
+                )
+                _index = PoiIndex(df)
+    return _index
+
+
+@lru_cache(maxsize=NEARBY_CACHE_SIZE)
+def nearby(lat, lon, radius_m, types, limit):
+    """Cached nearby lookup. Callers round lat/lon so nearby clicks share entries."""
+    return get_poi_index().query(lat, lon, radius_m, types, limit)
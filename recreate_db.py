@@ -1,5 +1,6 @@
 #!/usr/bin/env python
-from database import engine, Base
+from database import engine, Base, SessionLocal
+from dataset import bump_version
 from models import User, CrimeRecord
 from sqlalchemy import inspect, text
 
@@ -8,17 +9,26 @@ inspector = inspect(engine)
 existing_tables = inspector.get_table_names()
 print(f"Existing tables: {existing_tables}")
 
-# Drop crime_records if it exists
-if 'crime_records' in existing_tables:
-    with engine.connect() as conn:
-        conn.execute(text("DROP TABLE crime_records"))
-        conn.commit()
-    print("✓ Dropped old crime_records table")
+# Drop crime_records and its archive if they exist
+for table in ('crime_records', 'crime_archive', 'crime_cell_summary'):
+    if table in existing_tables:
+        with engine.connect() as conn:
+            conn.execute(text(f"DROP TABLE {table}"))
+            conn.commit()
+        print(f"✓ Dropped old {table} table")
 
 # Recreate all tables
 Base.metadata.create_all(bind=engine)
 print("✓ Recreated database schema")
 
+# Cached API responses refer to the old table contents
+session = SessionLocal()
+try:
+    bump_version(session)
+    session.commit()
+finally:
+    session.close()
+
 # Verify
 inspector = inspect(engine)
 print(f"\nFinal tables: {inspector.get_table_names()}")
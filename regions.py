@@ -0,0 +1,269 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from archive import load_cold_summary
+from crime_index import load_index
+from dataset import current_version, set_version
+from model import Hotspots
+
+# Region name -> bounding box (min_lat, min_lon, max_lat, max_lon). A JSON
+# file of the same shape can be given in REGIONS_FILE instead.
+DEFAULT_REGIONS = {
+    "chicago": (41.64, -87.95, 42.03, -87.52),
+    "sf_bay_area": (37.20, -122.60, 38.00, -121.70),
+}
+# Loaded regions are evicted least recently used first once they take more
+# than this much memory in total
+REGION_MEMORY_MB = float(os.getenv('REGION_MEMORY_MB', '512'))
+# Shard holding the crimes outside every configured region
+OTHER_REGION = "other"
+# Rough memory taken by one entry of a memoized /heatmap or /hotspots list
+AGGREGATE_ENTRY_BYTES = 240
+
+
+def load_regions():
+    path = os.getenv('REGIONS_FILE')
+    if not path:
+        return dict(DEFAULT_REGIONS)
+    with open(path) as f:
+        return {name: tuple(bbox) for name, bbox in json.load(f).items()}
+
+
+class RegionShard:
+    """One region's crime index, archive summary and derived aggregates.
+
+    A shard reflects one dataset version. Readers take ``index`` and
+    ``cold`` once per request, so replacing them never disturbs a request
+    in flight. ``content_version`` is the dataset version at which the
+    shard's crimes last changed, for ETags of per-region responses.
+
+    The shard of OTHER_REGION has no bounding box and holds everything
+    outside the boxes in ``exclude``.
+    """
+
+    def __init__(self, name, bbox, index, cold, version, exclude=()):
+        self.name = name
+        self.bbox = bbox
+        self.exclude = exclude
+        self.index = index
+        self.cold = cold
+        self.version = version
+        self.content_version = version
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self._aggregates = {}  # name -> (index, cold, value, approximate bytes)
+        self._aggregate_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, name, bbox, exclude=()):
+        index, version = load_index(bbox, exclude)
+        return cls(name, bbox, index, load_cold_summary(bbox, exclude), version, exclude)
+
+    def contains(self, lat, lon):
+        """Which of the points (numpy arrays) belong to this shard."""
+        inside = np.ones(len(lat), dtype=bool)
+        if self.bbox is not None:
+            inside &= _in_box(self.bbox, lat, lon)
+        for box in self.exclude:
+            inside &= ~_in_box(box, lat, lon)
+        return inside
+
+    def _aggregate(self, name, build, update, size):
+        """Return build(index, cold), memoized for the shard's current index and cold summary.
+
+        When only rows were ingested since the memoized value was made,
+        ``update(value, batches)`` brings it up to date from the ``with_rows``
+        batches instead; it may return None to ask for a full build.
+        ``size(value)`` estimates the memory the value takes.
+        """
+        index, cold = self.index, self.cold
+        hit = self._aggregates.get(name)
+        if hit and hit[0] is index and hit[1] is cold:
+            return hit[2]
+        # One build at a time: concurrent requests wait for it instead of repeating it
+        with self._aggregate_lock:
+            hit = self._aggregates.get(name)
+            if hit and hit[0] is index and hit[1] is cold:
+                return hit[2]
+            value = None
+            if hit and hit[1] is cold:
+                batches = index.added_since(hit[0])
+                if batches is not None:
+                    value = update(hit[2], batches)
+            if value is None:
+                value = build(index, cold)
+            self._aggregates[name] = (index, cold, value, size(value))
+        return value
+
+    def heatmap(self):
+        """Every crime of the shard as {"latitude", "longitude"}, for /heatmap.
+
+        Archived crimes come as one {"latitude", "longitude", "count"} point
+        per grid cell centre.
+        """
+        def points(lats, lons):
+            return [{"latitude": la, "longitude": lo} for la, lo in zip(lats.tolist(), lons.tolist())]
+
+        def build(index, cold):
+            lats, lons, counts = cold.centres()
+            archived = [
+                {"latitude": la, "longitude": lo, "count": int(n)}
+                for la, lo, n in zip(lats.tolist(), lons.tolist(), counts.tolist())
+            ]
+            return archived + points(index.lat, index.lon)
+
+        def update(value, batches):
+            # A new list, so responses still serializing the old one are unaffected
+            return value + [p for rows in batches for p in points(rows["lat"], rows["lon"])]
+
+        return self._aggregate("heatmap", build, update, lambda value: len(value) * AGGREGATE_ENTRY_BYTES)
+
+    def hotspots(self):
+        """KMeans clusters of the shard's crimes as {"latitude", "longitude", "count"}, for /hotspots.
+
+        Archived crimes count at their grid cell centres. Clusters are refit
+        at most every HOTSPOT_REFIT_SECONDS; crimes ingested in between are
+        added to their nearest cluster.
+        """
+        def build(index, cold):
+            lats, lons, counts = cold.centres()
+            return Hotspots(
+                np.concatenate([lats, index.lat]),
+                np.concatenate([lons, index.lon]),
+                np.concatenate([counts, np.ones(len(index))])
+            )
+
+        def update(value, batches):
+            if value.stale():
+                return None
+            for rows in batches:
+                value = value.with_points(rows["lat"], rows["lon"])
+                if value is None:
+                    return None
+            return value
+
+        hotspots = self._aggregate("hotspots", build, update, lambda value: AGGREGATE_ENTRY_BYTES)
+        return hotspots.clusters()
+
+    @property
+    def nbytes(self):
+        return self.index.nbytes + self.cold.nbytes + sum(hit[3] for hit in self._aggregates.values())
+
+
+def _in_box(bbox, lat, lon):
+    min_lat, min_lon, max_lat, max_lon = bbox
+    return (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+
+
+class RegionCache:
+    """Regional shards loaded on first use and evicted LRU under a memory budget.
+
+    ``names`` are the configured regions followed by OTHER_REGION, which
+    takes the crimes outside all of them.
+    """
+
+    def __init__(self, regions, budget_bytes):
+        self.regions = regions
+        self.names = list(regions) + [OTHER_REGION]
+        self.budget_bytes = budget_bytes
+        self.evictions = 0
+        self._shards = OrderedDict()  # name -> RegionShard, least recently used first
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.names}
+
+    def region_at(self, lat, lon):
+        """Name of the first region whose bounding box contains the point, or OTHER_REGION."""
+        for name, (min_lat, min_lon, max_lat, max_lon) in self.regions.items():
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                return name
+        return OTHER_REGION
+
+    def shard(self, name):
+        """Return the shard of a region, loading or reloading it for the current dataset version."""
+        version = current_version()
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is not None and shard.version == version:
+                self._shards.move_to_end(name)
+                shard.last_used = time.time()
+                return shard
+
+        # Only one load per region at a time; other regions stay available
+        with self._load_locks[name]:
+            with self._lock:
+                shard = self._shards.get(name)
+            if shard is None or shard.version != version:
+                if name == OTHER_REGION:
+                    shard = RegionShard.load(name, None, tuple(self.regions.values()))
+                else:
+                    shard = RegionShard.load(name, self.regions[name])
+                set_version(shard.version)
+            with self._lock:
+                self._shards[name] = shard
+                self._shards.move_to_end(name)
+                shard.last_used = time.time()
+                self._evict()
+        return shard
+
+    def shard_at(self, lat, lon):
+        return self.shard(self.region_at(lat, lon))
+
+    def _evict(self):
+        # The most recently used shard stays even if it alone exceeds the budget
+        while len(self._shards) > 1 and sum(s.nbytes for s in self._shards.values()) > self.budget_bytes:
+            self._shards.popitem(last=False)
+            self.evictions += 1
+
+    def apply_rows(self, rows, version):
+        """Add rows committed as dataset ``version`` to the loaded shards in place of a reload.
+
+        Shards not at ``version - 1`` missed another writer's commit and are
+        left alone, to be reloaded on their next use.
+        """
+        lat = np.asarray(rows["lat"], dtype=np.float64)
+        lon = np.asarray(rows["lon"], dtype=np.float64)
+        ids = np.asarray(rows["ids"])
+        with self._lock:
+            for shard in self._shards.values():
+                if shard.version != version - 1:
+                    continue
+                mask = shard.contains(lat, lon) & (ids > shard.index.max_id)
+                if mask.any():
+                    shard.index = shard.index.with_rows({name: np.asarray(col)[mask] for name, col in rows.items()})
+                    shard.content_version = version
+                shard.version = version
+            self._evict()
+
+    def status(self):
+        """Load state and memory use of every region, for /regions."""
+        with self._lock:
+            loaded = dict(self._shards)
+        regions = []
+        for name in self.names:
+            shard = loaded.get(name)
+            bbox = self.regions.get(name)
+            entry = {"name": name, "bbox": list(bbox) if bbox else None, "loaded": shard is not None}
+            if shard is not None:
+                entry.update({
+                    "crimes": len(shard.index),
+                    "memory_bytes": shard.nbytes,
+                    "version": shard.version,
+                    "content_version": shard.content_version,
+                    "loaded_at": shard.loaded_at,
+                    "last_used": shard.last_used,
+                })
+            regions.append(entry)
+        return {
+            "memory_budget_bytes": self.budget_bytes,
+            "memory_used_bytes": sum(s.nbytes for s in loaded.values()),
+            "evictions": self.evictions,
+            "regions": regions,
+        }
+
+
+region_cache = RegionCache(load_regions(), int(REGION_MEMORY_MB * 1024 * 1024))
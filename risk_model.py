@@ -0,0 +1,200 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+
+import joblib
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+from features import (
+    COUNT_ALL, FEATURE_STORE_PATH, FeatureGrid, cell_centres, cell_counts, cell_sums, derive, grid_shape, load_store
+)
+from crime_index import to_timestamp
+from dataset import current_version
+from model import NEARBY_KM, RECENT_DAYS
+
+RISK_MODEL_PATH = os.getenv('RISK_MODEL_PATH', 'risk_model.joblib')
+# Monthly snapshots of history used as training examples, per region
+TRAIN_SNAPSHOTS = int(os.getenv('RISK_MODEL_SNAPSHOTS', '36'))
+# Most points scored by one predict call
+MAX_BATCH = int(os.getenv('RISK_MODEL_MAX_BATCH', '10000'))
+# How long /analyze waits for a batched score before using the formula
+INFERENCE_TIMEOUT = float(os.getenv('RISK_MODEL_TIMEOUT', '1.0'))
+# Ingested crimes are added to the features as they arrive, but crimes never
+# age out of the look-back windows, so after this long /analyze goes back
+# to the formula until train_model.py is rerun
+MAX_STORE_AGE_HOURS = float(os.getenv('RISK_MODEL_MAX_AGE_HOURS', '24'))
+
+
+def training_examples(index, vocab, bbox, snapshots=TRAIN_SNAPSHOTS):
+    """(X, y) from monthly snapshots of a region's history, or None if it has none.
+
+    At each snapshot time T, every cell with crimes in its neighbourhood is
+    an example: features from the crimes up to T, labelled with the number
+    of crimes in the same neighbourhood over the following RECENT_DAYS.
+    """
+    if len(index) == 0:
+        return None
+    r0, c0, _, _ = grid_shape(bbox)
+    lats, lons = cell_centres(bbox)
+    horizon = RECENT_DAYS * 86400
+    last = int(index.ts[-1]) - horizon
+    times = [last - k * 30 * 86400 for k in range(snapshots)]
+
+    xs, ys = [], []
+    for at_ts in times:
+        if at_ts <= int(index.ts[0]):
+            break
+        sums = FeatureGrid(r0, c0, cell_sums(index, at_ts, vocab, bbox)).neighbourhood(lats, lons, NEARBY_KM)
+        active = sums[:, COUNT_ALL] > 0
+        future = FeatureGrid(r0, c0, cell_counts(index, at_ts, at_ts + horizon, bbox))
+        xs.append(derive(sums[active], vocab))
+        ys.append(future.neighbourhood(lats[active], lons[active], NEARBY_KM)[:, 0])
+    if not xs:
+        return None
+    return np.concatenate(xs), np.concatenate(ys)
+
+
+def fit(X, y):
+    """Fit the risk model: expected crimes nearby over the next RECENT_DAYS."""
+    estimator = HistGradientBoostingRegressor(loss="poisson", max_iter=200, learning_rate=0.1, random_state=0)
+    estimator.fit(X, y)
+    # Scores are the percentile of a prediction among the training predictions
+    quantiles = np.quantile(estimator.predict(X), np.linspace(0, 1, 101))
+    return estimator, quantiles
+
+
+class RiskModel:
+    """A trained estimator plus the feature store it scores from.
+
+    The store reflects dataset ``version``. ``apply_rows`` keeps it in step
+    with crimes ingested by this process; any other change (a reload, a
+    roll-over, another writer) leaves it behind, and ``is_current`` tells
+    /analyze to use the formula instead.
+    """
+
+    def __init__(self, estimator, quantiles, grids, vocab, built_at, version):
+        self.estimator = estimator
+        self.quantiles = quantiles
+        self.grids = grids
+        self.vocab = vocab
+        self.built_at = built_at
+        self.version = version
+        self._built_ts = to_timestamp(datetime.fromisoformat(built_at))
+        self._lock = threading.Lock()
+
+    def is_current(self, max_age_hours=MAX_STORE_AGE_HOURS):
+        """Whether the features match the current dataset and are recent enough to score from."""
+        age = to_timestamp(datetime.now()) - self._built_ts
+        return self.version == current_version() and age <= max_age_hours * 3600
+
+    def apply_rows(self, rows, version):
+        """Add rows committed as dataset ``version`` to the features, like RegionCache.apply_rows."""
+        with self._lock:
+            if self.version != version - 1:
+                return
+            self.grids = {
+                region: grid.with_rows(rows, self._built_ts, self.vocab) for region, grid in self.grids.items()
+            }
+            self.version = version
+
+    def predict(self, region, lats, lons):
+        """0-100 risk scores for arrays of points in region, or None if the region has no features.
+
+        Points without any crime on record nearby get NaN: the model was
+        only trained on neighbourhoods with history.
+        """
+        grid = self.grids.get(region)
+        if grid is None:
+            return None
+        sums = grid.neighbourhood(lats, lons, NEARBY_KM)
+        expected = self.estimator.predict(derive(sums, self.vocab))
+        scores = np.clip(np.searchsorted(self.quantiles, expected, side="left") - 1, 0, 100).astype(np.float64)
+        scores[sums[:, COUNT_ALL] == 0] = np.nan
+        return scores
+
+
+def load_risk_model(model_path=RISK_MODEL_PATH, store_path=FEATURE_STORE_PATH):
+    """Load the model written by train_model.py, or return None if it hasn't been run."""
+    if not (os.path.exists(model_path) and os.path.exists(store_path)):
+        return None
+    bundle = joblib.load(model_path)
+    grids, vocab, built_at, version = load_store(store_path)
+    if vocab != bundle["vocab"]:
+        print("❌ Feature store and risk model disagree on crime types; rerun train_model.py")
+        return None
+    return RiskModel(bundle["estimator"], bundle["quantiles"], grids, vocab, built_at, version)
+
+
+class InferenceBatcher:
+    """Scores single points from many request threads with one predict call per batch.
+
+    A worker thread takes whatever is queued (up to MAX_BATCH points) each
+    time it is free, so under load concurrent /analyze requests share a
+    predict call, and an idle server adds no waiting.
+    """
+
+    def __init__(self, model, max_batch=MAX_BATCH):
+        self.model = model
+        self.max_batch = max_batch
+        self.batches = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def score(self, region, lat, lon, timeout=INFERENCE_TIMEOUT):
+        """Risk score of one point, or None if the model can't score it (use the formula)."""
+        future = Future()
+        with self._cond:
+            self._queue.append((region, lat, lon, future))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="risk-model", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future.result(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            self.batches += 1
+            by_region = {}
+            for item in batch:
+                by_region.setdefault(item[0], []).append(item)
+            for region, items in by_region.items():
+                try:
+                    scores = self.model.predict(region, [i[1] for i in items], [i[2] for i in items])
+                except Exception as e:
+                    for item in items:
+                        item[3].set_exception(e)
+                    continue
+                for k, item in enumerate(items):
+                    item[3].set_result(None if scores is None or np.isnan(scores[k]) else int(scores[k]))
+
+
+_lock = threading.Lock()
+_batcher = None
+_loaded = False
+
+
+def get_batcher():
+    """The shared InferenceBatcher, or None when no trained model is available (use the formula)."""
+    global _batcher, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                model = load_risk_model()
+                _batcher = InferenceBatcher(model) if model is not None else None
+                _loaded = True
+    return _batcher
+
+
+def apply_rows(rows, version):
+    """Add committed rows to the served model's features, if there is a trained model."""
+    batcher = get_batcher()
+    if batcher is not None:
+        batcher.model.apply_rows(rows, version)
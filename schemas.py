@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+import datetime as dt
+from typing import List, Optional, Tuple
+from pydantic import BaseModel, Field, model_validator
 
 class UserCreate(BaseModel):
     name: str
@@ -7,4 +9,37 @@ class UserCreate(BaseModel):
 
 class UserLogin(BaseModel):
     email: str
-    password: str
\ No newline at end of file
+    password: str
+
+class CrimeCreate(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    severity: int = Field(1, ge=1, le=5)
+    crime_date: dt.date
+    time: dt.time = dt.time(12, 0)
+    crime_type: str = Field("Unknown", min_length=1, max_length=100)
+
+class GeofenceCreate(BaseModel):
+    """A circle (latitude, longitude, radius_m) or a polygon of [lat, lon] points."""
+    name: str = Field("My area", min_length=1, max_length=100)
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    radius_m: Optional[float] = Field(None, gt=0, le=20000)
+    polygon: Optional[List[Tuple[float, float]]] = Field(None, min_length=3, max_length=1000)
+    phone: Optional[str] = Field(None, max_length=20)
+    min_severity: int = Field(1, ge=1, le=5)
+
+    @model_validator(mode="after")
+    def circle_or_polygon(self):
+        circle = (self.latitude, self.longitude, self.radius_m)
+        if self.polygon is None and None in circle:
+            raise ValueError("give latitude, longitude and radius_m, or polygon")
+        if self.polygon is not None and circle != (None, None, None):
+            raise ValueError("give either a circle or a polygon, not both")
+        if self.polygon is not None:
+            lats = [p[0] for p in self.polygon]
+            lons = [p[1] for p in self.polygon]
+            # About the size of the largest circle
+            if max(lats) - min(lats) > 0.4 or max(lons) - min(lons) > 0.4:
+                raise ValueError("polygon may span at most 0.4 degrees")
+        return self
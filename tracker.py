@@ -0,0 +1,199 @@
+import numpy as np
+
+from crime_index import CELL_DEG, haversine_km, to_timestamp
+from grid import cells_covering, group_by_cell
+from model import NEARBY_KM, RECENT_DAYS, end_of_hour, score_risk, risk_level, location_adjusted
+from regions import region_cache
+from risk_model import get_batcher
+
+
+class RiskTracker:
+    """Risk score around one moving client, updated incrementally.
+
+    The neighbourhood is kept as per-grid-cell contributions (count,
+    severity sum, recent count). When the client moves, cells that stay
+    entirely inside the radius are reused as they are, cells that left the
+    radius are subtracted, and only cells on the edge of the circle are
+    re-examined crime by crime.
+
+    Crimes ingested while the client moves are added to the cells they fall
+    in rather than invalidating all of them.
+
+    Archived crimes are added from the cold summary for every cell that
+    intersects the circle, as /analyze does. They all predate the hot
+    partition, so they are never recent.
+
+    Like /analyze, "now" is scored by the learned model when its features
+    are current, and by the formula over these counts otherwise; the
+    ``scoring`` field of each update says which.
+    """
+
+    def __init__(self, radius_km=NEARBY_KM):
+        self.radius_km = radius_km
+        self.last = None
+        self._reset(None, None, None)
+
+    def _reset(self, index, cold, at):
+        self._index = index
+        self._cold = cold
+        self._at = at
+        self._cells = {}  # cell -> (fully_inside, count, severity_sum, recent_count)
+        self.count = 0
+        self.severity_sum = 0.0
+        self.recent_count = 0
+
+    def _add(self, contribution, sign):
+        _, count, severity_sum, recent_count = contribution
+        self.count += sign * count
+        self.severity_sum += sign * severity_sum
+        self.recent_count += sign * recent_count
+
+    def _fully_inside(self, cells, lat, lon):
+        """For each cell, whether all four corners (hence the whole cell) are within the radius."""
+        rows = np.array([c[0] for c in cells], dtype=np.float64)[:, None]
+        cols = np.array([c[1] for c in cells], dtype=np.float64)[:, None]
+        corners_lat = (rows + np.array([0, 0, 1, 1])) * CELL_DEG
+        corners_lon = (cols + np.array([0, 1, 0, 1])) * CELL_DEG
+        return (haversine_km(lat, lon, corners_lat, corners_lon) <= self.radius_km).all(axis=1).tolist()
+
+    def _intersecting(self, cells, lat, lon):
+        """For each cell, whether its nearest point to (lat, lon) is within the radius."""
+        rows = np.array([c[0] for c in cells], dtype=np.float64)
+        cols = np.array([c[1] for c in cells], dtype=np.float64)
+        near_lat = np.clip(lat, rows * CELL_DEG, (rows + 1) * CELL_DEG)
+        near_lon = np.clip(lon, cols * CELL_DEG, (cols + 1) * CELL_DEG)
+        return (haversine_km(lat, lon, near_lat, near_lon) <= self.radius_km).tolist()
+
+    def _full_cell(self, cell, at_ts, recent_ts):
+        """Contribution of a cell lying entirely inside the radius."""
+        index = self._index
+        cold_count, cold_severity = self._cold.totals.get(cell, (0, 0.0))
+        positions = index.cells.get(cell)
+        if positions is None:
+            return (True, cold_count, cold_severity, 0)
+        # Positions ascend by timestamp, so crimes after `at` are a suffix
+        ts = index.ts[positions]
+        upto = int(np.searchsorted(ts, at_ts, side="right"))
+        if upto == len(positions):
+            severity_sum = index.cell_severity(cell)
+        else:
+            severity_sum = float(index.severity[positions[:upto]].sum())
+        recent_count = upto - int(np.searchsorted(ts[:upto], recent_ts, side="right"))
+        return (True, upto + cold_count, severity_sum + cold_severity, recent_count)
+
+    def _edge_cells(self, cells, lat, lon, at_ts, recent_ts):
+        """Contributions of cells crossing the circle, checked crime by crime in one pass."""
+        index = self._index
+        empty = np.zeros(0, dtype=np.int64)
+        arrays = [index.cells.get(c, empty) for c in cells]
+        positions = np.concatenate(arrays)
+        labels = np.repeat(np.arange(len(cells)), [len(a) for a in arrays])
+        ts = index.ts[positions]
+        keep = (ts <= at_ts) & (haversine_km(lat, lon, index.lat[positions], index.lon[positions]) <= self.radius_km)
+        counts = np.bincount(labels[keep], minlength=len(cells)).tolist()
+        severity = np.bincount(labels[keep], weights=index.severity[positions[keep]], minlength=len(cells)).tolist()
+        recent = np.bincount(labels[keep & (ts > recent_ts)], minlength=len(cells)).tolist()
+        for i, (cell, inside) in enumerate(zip(cells, self._intersecting(cells, lat, lon))):
+            if inside and cell in self._cold.totals:
+                cold_count, cold_severity = self._cold.totals[cell]
+                counts[i] += cold_count
+                severity[i] += cold_severity
+        return [(False, counts[i], severity[i], recent[i]) for i in range(len(cells))]
+
+    def _replace(self, cell, contribution):
+        previous = self._cells.get(cell)
+        if previous is not None:
+            self._add(previous, -1)
+        self._add(contribution, 1)
+        self._cells[cell] = contribution
+
+    def _apply(self, rows, at_ts, recent_ts):
+        """Add newly indexed crimes to the fully-inside cells they fall in.
+
+        Edge cells are re-examined on every update anyway, and cells not held
+        yet are built from the new index when they are first covered.
+        """
+        keep = rows["ts"] <= at_ts
+        ts, severity = rows["ts"][keep], rows["severity"][keep]
+        for cell, positions in group_by_cell(rows["lat"][keep], rows["lon"][keep], CELL_DEG).items():
+            previous = self._cells.get(cell)
+            if previous is None or not previous[0]:
+                continue
+            recent_count = int((ts[positions] > recent_ts).sum())
+            self._replace(cell, (
+                True,
+                previous[1] + len(positions),
+                previous[2] + float(severity[positions].sum()),
+                previous[3] + recent_count,
+            ))
+
+    def update(self, lat, lon, at=None):
+        """Move to (lat, lon). Returns the new risk dict if score, level or scorer changed, else None."""
+        # The learned model only scores "now", as in /analyze
+        batcher = get_batcher() if at is None else None
+        if batcher is not None and not batcher.model.is_current():
+            batcher = None
+        # Hour granularity, as in /analyze, so contributions stay valid for the hour
+        at = at or end_of_hour()
+        shard = region_cache.shard_at(lat, lon)
+        index, cold = shard.index, shard.cold
+        at_ts = to_timestamp(at)
+        recent_ts = at_ts - RECENT_DAYS * 86400
+        if cold is not self._cold or at != self._at:
+            self._reset(index, cold, at)
+        elif index is not self._index:
+            # Ingested batches only add rows; anything else (a reload) starts over
+            added = index.added_since(self._index)
+            if added is None:
+                self._reset(index, cold, at)
+            else:
+                self._index = index
+                for rows in added:
+                    self._apply(rows, at_ts, recent_ts)
+
+        covered = [
+            c for c in cells_covering(lat, lon, self.radius_km, CELL_DEG)
+            if c in index.cells or c in cold.totals
+        ]
+        covered_set = set(covered)
+        for cell in [c for c in self._cells if c not in covered_set]:
+            self._add(self._cells.pop(cell), -1)
+
+        edge = []
+        for cell, full in zip(covered, self._fully_inside(covered, lat, lon) if covered else []):
+            if not full:
+                edge.append(cell)
+                continue
+            previous = self._cells.get(cell)
+            if previous is None or not previous[0]:
+                self._replace(cell, self._full_cell(cell, at_ts, recent_ts))
+        if edge:
+            for cell, contribution in zip(edge, self._edge_cells(edge, lat, lon, at_ts, recent_ts)):
+                self._replace(cell, contribution)
+
+        learned = None
+        if batcher is not None:
+            try:
+                learned = batcher.score(shard.name, lat, lon)
+            except Exception as e:
+                print(f"Risk model unavailable, using the formula: {e}")
+        if learned is not None:
+            score, scoring = learned, "model"
+            _, desc = risk_level(score)
+        elif self.count == 0:
+            score, desc, scoring = 5, "No major crimes nearby.", "formula"
+        else:
+            score, _, desc = score_risk(self.count, self.severity_sum / self.count, self.recent_count, at.hour)
+            scoring = "formula"
+        score, level = location_adjusted(score, lat, lon)
+
+        if self.last == (score, level, scoring):
+            return None
+        self.last = (score, level, scoring)
+        return {
+            "risk_score": score,
+            "risk_level": level,
+            "description": desc,
+            "nearby_crimes": self.count,
+            "scoring": scoring,
+        }
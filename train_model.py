@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Offline job: build the per-cell feature store and train the risk model on it.
+
+Usage: python train_model.py
+
+Reads all crime history (crime_records and crime_archive) region by region,
+writes the features as of now to FEATURE_STORE_PATH and the model to
+RISK_MODEL_PATH. Restart the API to serve them; until both files exist
+/analyze scores with the formula in model.py. The API also falls back to
+the formula once the store is older than RISK_MODEL_MAX_AGE_HOURS or
+the data changed other than through POST /crimes, so run this regularly.
+"""
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from crime_index import CrimeIndex, bbox_clause, to_timestamp
+from database import engine, Base
+from features import FEATURE_STORE_PATH, TOP_TYPES, FeatureGrid, cell_sums, grid_shape, save_store
+from regions import load_regions
+from risk_model import RISK_MODEL_PATH, fit, training_examples
+
+Base.metadata.create_all(bind=engine)
+
+now = datetime.now()
+indexes = {}
+with engine.connect() as conn:
+    version = conn.execute(text("SELECT version FROM dataset_meta WHERE id = 1")).scalar() or 0
+    for region, bbox in load_regions().items():
+        where, params = bbox_clause(bbox)
+        frames = [
+            pd.read_sql(
+                text(f"SELECT {id_column} AS id, latitude, longitude, severity, crime_date, time, crime_type FROM {table} WHERE {where}"),
+                conn,
+                params=params
+            )
+            for table, id_column in (("crime_records", "id"), ("crime_archive", "source_id"))
+        ]
+        indexes[region] = (bbox, CrimeIndex(pd.concat(frames, ignore_index=True)))
+        print(f"{region}: {len(indexes[region][1])} crimes")
+
+# One type vocabulary for every region, so features line up across them
+type_counts = pd.Series(dtype=np.int64)
+for bbox, index in indexes.values():
+    names = pd.Series(np.asarray(index.types.names, dtype=object)[index.type_code])
+    type_counts = type_counts.add(names.value_counts(), fill_value=0)
+vocab = type_counts.sort_values(ascending=False, kind="stable").index[:TOP_TYPES].tolist()
+
+xs, ys, grids = [], [], {}
+for region, (bbox, index) in indexes.items():
+    r0, c0, _, _ = grid_shape(bbox)
+    grids[region] = FeatureGrid(r0, c0, cell_sums(index, to_timestamp(now), vocab, bbox))
+    examples = training_examples(index, vocab, bbox)
+    if examples is not None:
+        xs.append(examples[0])
+        ys.append(examples[1])
+
+if not xs or sum(len(x) for x in xs) < 50:
+    print("❌ Not enough crime history to train the risk model")
+    exit(1)
+
+X, y = np.concatenate(xs), np.concatenate(ys)
+print(f"Training on {len(X)} examples ({int((y > 0).sum())} with crimes in the following month)...")
+estimator, quantiles = fit(X, y)
+
+save_store(FEATURE_STORE_PATH, grids, vocab, now.isoformat(timespec="seconds"), version)
+joblib.dump({"estimator": estimator, "quantiles": quantiles, "vocab": vocab, "trained_at": now.isoformat()}, RISK_MODEL_PATH)
+print(f"\n✅ Wrote {FEATURE_STORE_PATH} and {RISK_MODEL_PATH}. Restart the API to serve them.")